@@ -3,417 +3,350 @@
 
 import pandas as pd
 import numpy as np
-import re
+import os
+import time
+import logging
 import datetime
 
-def pls_Scoring_Fcn(root_filepath, REDCap_raw_scores_file, 
-                    id_column, event_name_column, age_column, ac_column, ec_column, output_file_location):
+from PLS_norms import load_norms, find_age_bands, REF_MATERIALS_DIR, AGE_PATTERN
+from PLS_ledger import open_ledger, unscored_rows, record_scored, visit_keys
+from PLS_metrics import ScoringMetrics, profiling
+from PLS_writers import open_writer, output_format_for
+from PLS_validation import validate_raw_scores, validate_export, summarize, ValidationError
+from PLS_longitudinal import trajectory_inputs, compute_trajectories
+from PLS_mirror import load_mirrored_norms
 
-    # import the REDCap raw scores
-    file_ext = REDCap_raw_scores_file[-4:]
+logger = logging.getLogger('PLS')
 
-    if file_ext == ".xlsx":
-        raw_scores_df = pd.read_excel(root_filepath + REDCap_raw_scores_file)
-    elif file_ext == ".csv":
-        raw_scores_df = pd.read_csv(root_filepath + REDCap_raw_scores_file)
-
-    # Modifies the df to consist of only those columns
-    raw_scores_df = raw_scores_df[[id_column, event_name_column, age_column, ac_column, ec_column]]
-
-    # Change column names
-    raw_scores_df.columns = ['id', 'Event Name', 'AGE', 'AC Raw', 'EC Raw']
-    raw_scores_df = raw_scores_df.dropna(subset=['AGE'], how='all')
-
-    # Reformatting the age to accommodate the y:m
-    def format_age_value(ae_value):
-        ae_value = ae_value.strip()
-        if ':' in ae_value:
-            return ae_value
-        elif 'y' in ae_value and 'm' in ae_value:
-            match = re.match(r'(\d+)y(\d+)m', ae_value)
-            if match:
-                years, months = map(int, match.groups())
-                return f'{years}.{months}'
-            else:
-                raise ValueError(f"Unsupported format for ae_value: {ae_value}")
-        else:
-            return ae_value.replace(':', '.')
 
-    raw_scores_df["AGE"] = raw_scores_df["AGE"].apply(format_age_value)
+def parse_age_values(ages):
+    '''
+    Purpose: Parses every age in a column with vectorized string operations
+
+    - Returns the age as a years.months string (used in the study ID) and as total months
+    - Ages with more than 11 months get no total months, so they are flagged as invalid
+    - Raises ValueError listing any ages that are not in a supported format
+    '''
+    ages = ages.astype(str).str.strip()
+    parts = ages.str.extract(AGE_PATTERN)
+    unsupported = parts["years"].isna()
+    if unsupported.any():
+        raise ValueError(f"Unsupported format for ae_value: {', '.join(ages[unsupported].unique())}")
+
+    years = parts["years"].astype(int)
+    months = parts["ym_months"].fillna(parts["months"]).astype(int)
+    age_strings = years.astype(str) + '.' + months.astype(str)
+    total_months = (years * 12 + months).where(months < 12).astype("Int32")
+    return age_strings, total_months
+
+
+def lookup_ss_pr(raw_values, score_table):
+    '''
+    Purpose: Returns standard scores and percentile ranks for an array of raw scores in one age band
+
+    - score_table: compiled arrays from PLS_norms.compile_score_table
+    - -999 raw scores (and unmatched raw scores) stay -999
+    - Raw scores below the second row of the sheet take the first row's scores (floor rule)
+    - A raw score of 999 (empty value) returns 999
+    '''
+    ss = np.full(len(raw_values), -999.0)
+    pr = np.full(len(raw_values), -999.0)
+    valid = ~np.isnan(raw_values) & (raw_values != -999)
+
+    # Raw scores found in the sheet
+    size = len(score_table['ss'])
+    in_table = valid & (raw_values >= 0) & (raw_values < size) & (raw_values == np.floor(raw_values))
+    idx = np.where(in_table, raw_values, 0).astype(int)
+    if size:
+        in_table &= score_table['matched'][idx]
+    ss[in_table] = score_table['ss'][idx[in_table]]
+    pr[in_table] = score_table['pr'][idx[in_table]]
+
+    # Floor rule, then empty values
+    below_floor = valid & (raw_values < score_table['floor_raw'])
+    ss[below_floor] = score_table['floor_ss']
+    pr[below_floor] = score_table['floor_pr']
+    empty = valid & ~below_floor & (raw_values == 999)
+    ss[empty] = 999
+    pr[empty] = 999
+
+    # The last row of the sheet still wins when it matches the raw score
+    last_row = (below_floor | empty) & (raw_values == score_table['last_raw'])
+    ss[last_row] = score_table['last_ss']
+    pr[last_row] = score_table['last_pr']
+
+    return ss, pr
+
+
+def lookup_total_ss(ac_ss, ec_ss, total_ss_table):
+    '''
+    Purpose: Returns Total Language Standard Scores and Percentile Ranks for arrays of AC and EC SS
+
+    - total_ss_table: compiled intervals from PLS_norms.compile_total_ss_table
+    - If either SS is 999 (or the sum is 999), the totals are 999
+    - If either SS is -999 (missing), the totals are -999
+    - Sums that fall outside every interval are -999 and flagged in the returned unmatched mask
+    '''
+    total_ss = np.full(len(ac_ss), -999, dtype=object)
+    total_pr = np.full(len(ac_ss), -999, dtype=object)
+    sum_ac_ec_ss = ac_ss + ec_ss
+
+    empty = (ac_ss == 999) | (ec_ss == 999) | (sum_ac_ec_ss == 999)
+    missing = ~empty & ((ac_ss == -999) | (ec_ss == -999) | np.isnan(sum_ac_ec_ss))
+    to_score = ~empty & ~missing
+
+    # Find the interval whose lower bound is the last one at or below the sum
+    idx = np.searchsorted(total_ss_table['lower'], sum_ac_ec_ss, side='right') - 1
+    idx_safe = np.clip(idx, 0, None)
+    in_interval = (to_score & (idx >= 0) & (len(total_ss_table['lower']) > 0)
+                   & (sum_ac_ec_ss <= total_ss_table['upper'][idx_safe]))
+
+    total_ss[in_interval] = total_ss_table['ss'][idx_safe[in_interval]]
+    total_pr[in_interval] = total_ss_table['pr'][idx_safe[in_interval]]
+    total_ss[empty] = 999
+    total_pr[empty] = 999
+
+    return total_ss, total_pr, to_score & ~in_interval
 
-    # Remove rows where age is 0
-    raw_scores_df = raw_scores_df[raw_scores_df["AGE"] != 0]
-    
-    # Create a unique study ID
-    raw_scores_df['study_id'] = raw_scores_df[['id', 'AGE']].apply(lambda x: '-'.join(x.dropna().astype(str)), axis=1)
-    raw_scores_df.set_index("study_id", inplace=True)
-    raw_scores_df.drop(columns=["id"], inplace=True)
-
-    # Define age ranges and associated sheet names for AC and EC sheets
-    key_sheet_mapping = {
-        '0.0-0.2': '0.0-0.2',
-        '0.3-0.5': '0.3-0.5',
-        '0.6-0.8': '0.6-0.8',
-        '0.9-1.1': '0.9-1.1',
-        '1.0-1.5': '1.0-1.5',
-        '1.6-1.11': '1.6-1.11',
-        '2.0-2.5': '2.0-2.5',
-        '2.6-2.11': '2.6-2.11',
-        '3.0-3.5': '3.0-3.5',
-        '3.6-3.11': '3.6-3.11',
-        '4.0-4.5': '4.0-4.5',
-        '4.6-4.11': '4.6-4.11',
-        '5.0-5.5': '5.0-5.5',
-        '5.6-5.11': '5.6-5.11',
-        '6.0-6.5': '6.0-6.5',
-        '6.6-6.11': '6.6-6.11',
-        '7.0-7.5': '7.0-7.5',
-        '7.6-7.11': '7.6-7.11',
-    }
 
-    # Convert the dictionary to a DataFrame for easy manipulation
-    df_key_map = pd.DataFrame.from_dict(key_sheet_mapping, orient="index", columns=["age range sheet name"])
-    df_key_map.index = pd.RangeIndex(start=1, stop=len(df_key_map) + 1, name="sheet number")
-
-    # Generate a DataFrame that maps sheet number to ages
-    # Each sheet number is specific to a particular set of ages
-    df_ref_key = pd.DataFrame(index=df_key_map.index)
-    df_ref_key["age range"] = df_key_map.apply(
-        lambda row: f"{row['age range sheet name']}: {', '.join(map(str, [f'{x:.1f}' for x in list(float(age) for age in row['age range sheet name'].split('-'))]))}",
-        axis=1
-    )
-
-    def find_ref_table(age_to_ref, df_ref_key):
-        # Split the age into integer and decimal parts
-        age_int, age_dec = map(int, age_to_ref.split('.'))
-
-        # Iterate over each row in the reference key DataFrame
-        for idx, row in df_ref_key.iterrows():
-            # Get the age range sheet name from the DataFrame
-            age_range_sheet_name = row['age range sheet name']
-            # Split the start and end ages of the age range
-            start_age_str, end_age_str = age_range_sheet_name.split('-')
-            # Split the start and end ages into integer and decimal parts
-            start_age_int, start_age_dec = map(int, start_age_str.split('.'))
-            end_age_int, end_age_dec = map(int, end_age_str.split('.'))
-
-            # Compare the age to the age range
-            # Check if the age falls within the range based on integer and decimal parts
-            if (age_int == start_age_int and age_int == end_age_int) and (start_age_dec <= age_dec <= end_age_dec):
-                return age_range_sheet_name
-            elif age_int == start_age_int and age_int < end_age_int and age_dec >= start_age_dec:
-                return age_range_sheet_name
-            elif age_int > start_age_int and age_int == end_age_int and age_dec <= end_age_dec:
-                return age_range_sheet_name
-            elif start_age_int < age_int and age_int < end_age_int:
-                return age_range_sheet_name
+def lookup_ae_gsv(raw_values, ae_table, label):
+    '''
+    Purpose: Returns age equivalents (years and months formats) and GSVs for an array of raw scores
+
+    - ae_table: compiled arrays from PLS_norms.compile_ae_table
+    - -999 raw scores and raw scores missing from the table return -999 (GSV as the string '-999')
+    - Raises ValueError if a matched age equivalent is not in the '[<>]y-m' format
+    '''
+    ae_years = np.full(len(raw_values), -999, dtype=object)
+    ae_months = np.full(len(raw_values), -999, dtype=object)
+    gsv = np.full(len(raw_values), '-999', dtype=object)
+
+    size = len(ae_table['matched'])
+    in_table = (~np.isnan(raw_values) & (raw_values != -999) & (raw_values >= 0)
+                & (raw_values < size) & (raw_values == np.floor(raw_values)))
+    idx = np.where(in_table, raw_values, 0).astype(int)
+    if size:
+        in_table &= ae_table['matched'][idx]
+
+    bad_ae = in_table & ~ae_table['ae_valid'][idx] if size else in_table
+    if bad_ae.any():
+        raise ValueError(f"Unsupported format for {label}: {ae_table['ae'][idx[bad_ae]][0]}")
+
+    ae_years[in_table] = ae_table['ae_years'][idx[in_table]]
+    ae_months[in_table] = ae_table['ae_months'][idx[in_table]]
+    gsv[in_table] = ae_table['gsv'][idx[in_table]]
+    return ae_years, ae_months, gsv
+
+
+def compact_raw_scores(values):
+    '''
+    Purpose: Returns raw scores as nullable Int16 when every value is a whole number (float otherwise)
+
+    - Missing values become <NA>; the -999 and 999 codes fit in Int16 and are kept as they are
+    - Scores with decimals are left as float so they still reach scoring unchanged
+    '''
+    values = pd.to_numeric(values)
+    whole = values.dropna()
+    if ((whole == np.floor(whole)) & (whole.abs() <= np.iinfo(np.int16).max)).all():
+        return values.astype('Int16')
+    return values
+
+
+def _compact_dtypes(raw_scores_df, columns):
+    # Small integer raw scores and a categorical event column (a handful of distinct events)
+    id_column, event_name_column, age_column, ac_column, ec_column = columns
+    raw_scores_df[event_name_column] = raw_scores_df[event_name_column].astype('category')
+    raw_scores_df[ac_column] = compact_raw_scores(raw_scores_df[ac_column])
+    raw_scores_df[ec_column] = compact_raw_scores(raw_scores_df[ec_column])
+    return raw_scores_df
+
+
+def _read_csv_with_pyarrow(filepath, columns):
+    # pyarrow's multithreaded CSV reader, or None when pyarrow is not installed
+    try:
+        import pyarrow as pa
+        import pyarrow.csv
+    except ImportError:
         return None
 
-    # Create an empty DataFrame to store the T scores
-    df_ss_scores = pd.DataFrame()
-
-    # Loop through each individual ID's row of raw scores
-    for i in raw_scores_df.index:
-        # Get the age of the participant
-        age_to_ref_float = str(raw_scores_df.loc[i, "AGE"])
-        # Find the correct age group to pull the correct reference tables
-        age_group = find_ref_table(age_to_ref_float, df_key_map)
-        print("Reference table for", i, "with", age_to_ref_float, "is:", age_group)
-
-        # Read in the reference tables for AC and EC, make sure age is valid
-        if age_group not in key_sheet_mapping:
-            raw_scores_df.loc[i, 'age_validity'] = f'FIX AGE INPUT FOR {i}'
-            continue
-
-        '''
-        Purpose: Returns AC and EC Standard Scores and Percentile Ranks
-
-        - Takes participant's raw AC and EC scores from raw_scores_df
-        - Using AC and EC raw scores, finds corresponding standard scores in (ac/ec)_ref_table
-        - Using AC and EC raw scores, finds corresponding percentile rank in (ac/ec)_ref_table
-        - Saves AC and EC standard scores and percentile rank in new dataframe: df_ss_scores
-        '''
-        # reads ref_material
-        ac_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.1 AC Scores.xlsx', key_sheet_mapping[age_group], header=None)
-        ec_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.2 EC Scores.xlsx', key_sheet_mapping[age_group], header=None)
-
-        ac_raw = raw_scores_df.loc[i, "AC Raw"]
-        ec_raw = raw_scores_df.loc[i, "EC Raw"]
-
-        # Match AC Raw score to the corresponding range in the AC reference table
-        ac_ss_score = -999
-        ac_percentile_rank = -999
-        if ac_raw == -999:
-            ac_ss_score = -999
-            ac_percentile_rank = -999
-        else:
-            for index, row in ac_ref_table.iterrows():  # Iterate through the rows of the ac_ref_table DataFrame
-                if ac_raw == row.iloc[0]:  # Check if raw score matches value in first column of ac_ref_table
-                    ac_ss_score = row.iloc[1]  # If a match is found, retrieve the standard score from the second column
-                    # If the raw score is less than the value in the second row of the first column in "ac_ref_table",
-                elif ac_raw < ac_ref_table.iloc[1, 0]:
-                    ac_ss_score = ac_ref_table.iloc[0, 1]  # Set ss_score to the value in the first row of second column
-                elif ac_raw == 999:  # Account for empty values
-                    ac_ss_score = 999
-
-            for index, row in ac_ref_table.iterrows(): # Iterate through the rows of the ac_ref_table DataFrame
-                if ac_raw == row.iloc[0]:  # Check if raw score matches value in first column of ac_ref_table
-                    ac_percentile_rank = row.iloc[2]  # If match is found, retrieve percentile rank from third column
-                # If the raw score is less than the value in the second row of the first column in "ac_ref_table",
-                elif ac_raw < ac_ref_table.iloc[1, 0]:
-                    ac_percentile_rank = ac_ref_table.iloc[0, 2]  # Set PR to value in 1st row of 3rd column
-                elif ac_raw == 999:  # Account for empty values
-                    ac_percentile_rank = 999
-
-        # Match EC Raw score to the corresponding range in the EC reference table
-        ec_ss_score = -999
-        ec_percentile_rank = -999
-        if ec_raw == -999:
-            ec_ss_score = -999
-            ec_percentile_rank = -999
-        else:
-            # Iterate through each row in the EC reference table
-            for index, row in ec_ref_table.iterrows():
-                # Check if the raw score matches the value in the first column of ec_ref_table
-                if ec_raw == row.iloc[0]:
-                    ec_ss_score = row.iloc[1]  # Retrieve the standard score from the second column
-                    # If the raw score is less than the value in the second row of the first column in "ec_ref_table",
-                elif ec_raw < ec_ref_table.iloc[1, 0]:
-                    ec_ss_score = ec_ref_table.iloc[0, 1]  # Set ss_score to the value in the first row of second column
-                elif ec_raw == 999:  # Account for empty values
-                    ec_ss_score = 999
-
-            # Iterate through each row in the EC reference table
-            for index, row in ec_ref_table.iterrows():
-                # Check if the raw score matches the value in the first column of ec_ref_table
-                if ec_raw == row.iloc[0]:
-                    ec_percentile_rank = row.iloc[2]  # Retrieve percentile rank from the third column
-                # If the raw score is less than the value in the second row of the first column in "ec_ref_table",
-                elif ec_raw < ec_ref_table.iloc[1, 0]:
-                    ec_percentile_rank = ec_ref_table.iloc[0, 2]  # Set PR to value in 1st row of 3rd column
-                elif ec_raw == 999:  # Account for empty values
-                    ec_percentile_rank = 999
-
-        df_ss_scores.loc[i, "AC_SS"] = ac_ss_score
-        df_ss_scores.loc[i, "AC_Percentile_Rank"] = ac_percentile_rank
-        df_ss_scores.loc[i, "EC_SS"] = ec_ss_score
-        df_ss_scores.loc[i, "EC_Percentile_Rank"] = ec_percentile_rank
-
-
-    # Calculate Total Language Standard Score and Percentile Rank
-    df_total_lang_ss_scores = pd.DataFrame(columns=["Total Language Standard Score", "Total Language Percentile Rank"])
-    total_ss_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.3 Total Standard Score.xlsx', header=None)
-
-    # Iterate through each row in df_ss_scores
-    for i, row in df_ss_scores.iterrows():
-        if row['AC_SS'] == 999 or row['EC_SS'] == 999:
-            # If either AC_SS or EC_SS is 999, set total_ss_score and total_pr_score to 999
-            total_ss_score = 999
-            total_pr_score = 999
-        else:
-            # Calculate sum of AC_SS and EC_SS
-            sum_ac_ec_ss_score = row['AC_SS'] + row['EC_SS']
-            
-            # Iterate through each row in the total_ss_ref_table
-            for index, ref_row in total_ss_ref_table.iterrows():
-                range_of_sum = ref_row.iloc[0]  # Get the range of sum from the reference table
-                total_ss_value = ref_row.iloc[1]  # Get the corresponding total standard score
-                total_pr_value = ref_row.iloc[2]  # Get the corresponding total percentile rank
-                
-                # Check if sum_ac_ec_ss_score is 999 (accounting for empty values)
-                if sum_ac_ec_ss_score == 999:
-                    total_ss_score = 999
-                    total_pr_score = 999
-                    break
-
-                # Check if range_of_sum contains a hyphen (indicating a range)
-                elif '-' in str(range_of_sum):
-                    lower, upper = map(int, range_of_sum.split('-'))  # Split range into lower and upper bounds
-                    # If sum_ac_ec_ss_score falls within the range, assign corresponding scores
-                    if lower <= sum_ac_ec_ss_score <= upper:
-                        total_ss_score = total_ss_value
-                        total_pr_score = total_pr_value
-                        break
-                # If range_of_sum is a single value
-                elif int(range_of_sum) == sum_ac_ec_ss_score:
-                    total_ss_score = total_ss_value
-                    total_pr_score = total_pr_value
-                    break
-
-        # Store total language standard scores and percentile ranks in df_total_lang_ss_scores after the inner loop
-        df_total_lang_ss_scores.loc[i, "Total Language Standard Score"] = total_ss_score
-        df_total_lang_ss_scores.loc[i, "Total Language Percentile Rank"] = total_pr_score
+    id_column, event_name_column, age_column, ac_column, ec_column = columns
+    # Types are given to the reader itself so IDs such as 001 are never parsed as numbers
+    column_types = {id_column: pa.string(), event_name_column: pa.dictionary(pa.int32(), pa.string()),
+                    age_column: pa.string(), ac_column: pa.float64(), ec_column: pa.float64()}
+    convert_options = pyarrow.csv.ConvertOptions(include_columns=list(columns), column_types=column_types,
+                                                 strings_can_be_null=True)
+    return pyarrow.csv.read_csv(filepath, convert_options=convert_options).to_pandas()
 
-    """
-    Purpose: Returns Total Language Age Equivalents in Years and Months
 
-    - Initializes empty dataframe (df_total_ae_scores)
-    - reads in Total Age Equivalent reference table
-    - Takes participant's raw AC and EC scores from raw_scores_df, and calculates their sum (sum_ac_ec_raw)
-    - Using sum of raw scores, finds corresponding Total Age Equivalent in Total Age Equivalent reference table
-    - Converts age equivalent into both years format (#y#m) and months format (##)
-    - Saves age equivalents in new dataframe: df_total_ae_scores
-    """
-    # AC and EC Age Equivalents- Years and Months
-    df_ac_ec_ae_scores = pd.DataFrame()  # Initialize a DataFrame to store age equivalents
-
-    # AC Age Equivalents
-    ac_ae_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.4 AC gsv + ae.xlsx')  # Read AC reference table
-
-    # EC Age Equivalents
-    ec_ae_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.5 EC gsv + ae.xlsx')  # Read EC reference table
-
-    # Iterate over each participant in the raw_scores_df DataFrame
-    for i, row in raw_scores_df.iterrows():
-        # Extract raw scores for AC and EC subscales
-        ac_raw = raw_scores_df.loc[i, "AC Raw"]
-        ec_raw = raw_scores_df.loc[i, "EC Raw"]
-
-        # Find AC Age Equivalent
-        ac_age_equivalent = -999
-        if ac_raw != -999:
-            ac_match = ac_ae_ref_table.loc[ac_ae_ref_table.iloc[:, 0] == ac_raw]
-            if not ac_match.empty:
-                ac_age_equivalent = ac_match.iloc[0, 1]
-
-        # Calculate AC age equivalent in years and months
-        if ac_age_equivalent == -999:
-            ac_age_equivalent_years = -999
-            ac_age_equivalent_months = -999
-        else:
-            # Extract years and months
-            match = re.match(r'([<>]?)(\d+)-(\d+)', ac_age_equivalent)
-            if match:
-                prefix = match.group(1)
-                years = int(match.group(2))
-                months = int(match.group(3))
-                ac_age_equivalent_years = f'{prefix}{years}y{months}m' if prefix else f'{years}y{months}m'
-                ac_age_equivalent_months = f'{prefix}{years * 12 + months}' if prefix else f'{years * 12 + months}'
-            else:
-                raise ValueError(f"Unsupported format for ac_age_equivalent: {ac_age_equivalent}")
-
-        # Store AC age equivalents in the DataFrame
-        df_ac_ec_ae_scores.loc[i, "AC AE Years"] = ac_age_equivalent_years
-        df_ac_ec_ae_scores.loc[i, "AC AE Months"] = ac_age_equivalent_months
-
-        # Find EC Age Equivalent
-        ec_age_equivalent = -999
-        if ec_raw != -999:
-            ec_match = ec_ae_ref_table.loc[ec_ae_ref_table.iloc[:, 0] == ec_raw]
-            if not ec_match.empty:
-                ec_age_equivalent = ec_match.iloc[0, 1]
-
-        if ec_age_equivalent == -999:
-            ec_age_equivalent_years = -999
-            ec_age_equivalent_months = -999
-        else:
-            # Extract years and months
-            match = re.match(r'([<>]?)(\d+)-(\d+)', ec_age_equivalent)
-            if match:
-                prefix = match.group(1)
-                years = int(match.group(2))
-                months = int(match.group(3))
-                ec_age_equivalent_years = f'{prefix}{years}y{months}m' if prefix else f'{years}y{months}m'
-                ec_age_equivalent_months = f'{prefix}{years * 12 + months}' if prefix else f'{years * 12 + months}'
-            else:
-                raise ValueError(f"Unsupported format for ec_age_equivalent: {ec_age_equivalent}")
+def read_raw_scores(filepath, columns, chunksize=None):
+    '''
+    Purpose: Reads the five configured columns of a REDCap export
+
+    - columns: (id, event name, age, AC raw, EC raw) column names
+    - Only those columns are parsed (usecols), IDs and ages as text, events as a categorical and
+      raw scores as small integers (see compact_raw_scores)
+    - .csv exports are read with the pyarrow engine when it is installed (not in streaming mode)
+    - With chunksize, returns an iterator of DataFrames of at most chunksize rows (.csv exports only)
+    '''
+    id_column, event_name_column, age_column, ac_column, ec_column = columns
+    dtypes = {id_column: str, event_name_column: str, age_column: str, ac_column: float, ec_column: float}
+    file_ext = os.path.splitext(filepath)[1].lower()
+
+    if file_ext == ".xlsx":
+        if chunksize is not None:
+            raise ValueError("Streaming mode (chunksize) needs a .csv REDCap export")
+        raw_scores_df = pd.read_excel(filepath, usecols=list(columns), dtype=dtypes)
+    elif file_ext == ".csv":
+        if chunksize is not None:
+            chunks = pd.read_csv(filepath, usecols=list(columns), dtype=dtypes, chunksize=chunksize)
+            return (_compact_dtypes(chunk, columns) for chunk in chunks)
+        raw_scores_df = _read_csv_with_pyarrow(filepath, columns)
+        if raw_scores_df is None:
+            raw_scores_df = pd.read_csv(filepath, usecols=list(columns), dtype=dtypes)
+    else:
+        raise ValueError(f"Unsupported REDCap export format: {filepath}")
+    return _compact_dtypes(raw_scores_df, columns)
+
+
+def raw_scores_from_records(records, columns):
+    '''
+    Purpose: Turns REDCap-style records (list of dicts or DataFrame, values as text) into a raw scores frame
 
-        # Store EC age equivalents in the DataFrame
-        df_ac_ec_ae_scores.loc[i, "EC AE Years"] = ec_age_equivalent_years
-        df_ac_ec_ae_scores.loc[i, "EC AE Months"] = ec_age_equivalent_months
+    - Empty values ('') become missing and the columns get the same types as in read_raw_scores
+    '''
+    raw_scores_df = pd.DataFrame(records).reindex(columns=list(columns))
+    raw_scores_df = raw_scores_df.where(raw_scores_df != '')
+    return _compact_dtypes(raw_scores_df, columns)
 
-    # Initialize empty dataframe for total age equivalents
-    df_total_ae_scores = pd.DataFrame()
 
-    # Reading Total Age Equivalents reference table
-    total_ae_ref_table = pd.read_excel(root_filepath + 'Assessment_Packages/PLS_package/PLS_ref_materials/A.6 Total ae.xlsx')
+def prepare_raw_scores(raw_scores_df, columns):
+    '''
+    Purpose: Renames the export columns, parses the ages and indexes the rows by study ID
 
-    # Iterate over rows of the DataFrame
-    for i, row in raw_scores_df.iterrows():
-        # Extract AC and EC raw scores from the DataFrame
-        ac_raw = row["AC Raw"]
-        ec_raw = row["EC Raw"]
+    - The "id" column keeps each row's full subject ID as text (the study ID when the id is missing),
+      since the index and the import file cut the ID at its first '-'
+    '''
+    # Keep only those columns, under the names used by the scoring stages
+    raw_scores_df = raw_scores_df[list(columns)].set_axis(['id', 'Event Name', 'AGE', 'AC Raw', 'EC Raw'], axis=1)
+    raw_scores_df = raw_scores_df.dropna(subset=['AGE'])
 
-        if ac_raw == -999 or ec_raw == -999:
-            sum_ac_ec_raw = -999
-        else:
-            sum_ac_ec_raw = ac_raw + ec_raw
+    # Parse the ages (#y#m, y:m or y.m) into years.months strings and total months
+    raw_scores_df["AGE"], raw_scores_df["AGE Months"] = parse_age_values(raw_scores_df["AGE"])
 
-        total_age_equivalent = -999
-        if sum_ac_ec_raw != -999:
-            total_match = total_ae_ref_table.loc[total_ae_ref_table.iloc[:, 0] == sum_ac_ec_raw]
-            if not total_match.empty:
-                total_age_equivalent = total_match.iloc[0, 1]
+    # Create a unique study ID (id-years.months, or just the age when the id is missing)
+    ids = raw_scores_df['id']
+    study_id = (ids.astype(str) + '-' + raw_scores_df['AGE']).where(ids.notna(), raw_scores_df['AGE'])
+    raw_scores_df["id"] = ids.astype(str).where(ids.notna(), study_id)
+    raw_scores_df = raw_scores_df.set_axis(pd.Index(study_id, name="study_id"), axis=0)
 
-        if total_age_equivalent == -999:
-            total_age_equivalent_years = -999
-            total_age_equivalent_months = -999
-        else:
-            # Extract years and months
-            match = re.match(r'([<>]?)(\d+)-(\d+)', total_age_equivalent)
-            if match:
-                prefix = match.group(1)
-                years = int(match.group(2))
-                months = int(match.group(3))
-                total_age_equivalent_years = f'{prefix}{years}y{months}m' if prefix else f'{years}y{months}m'
-                total_age_equivalent_months = f'{prefix}{years * 12 + months}' if prefix else f'{years * 12 + months}'
-            else:
-                raise ValueError(f"Unsupported format for total_age_equivalent: {total_age_equivalent}")
+    return raw_scores_df
 
-        # Append the Total Age Equivalents to df_total_ae_scores dataframe
-        df_total_ae_scores.loc[i, "Total AE Years"] = total_age_equivalent_years
-        df_total_ae_scores.loc[i, "Total AE Months"] = total_age_equivalent_months
 
+def assign_age_bands(raw_scores_df):
+    '''
+    Purpose: Returns the age-band sheet name of every participant (None if the age is out of range)
     '''
-    Purpose:  Returns AC and EC Growth Scale Values (GSVs)
+    # Find the correct age group (reference sheet) for every participant in one lookup
+    age_groups = pd.Series(find_age_bands(raw_scores_df["AGE Months"].to_numpy(dtype=float, na_value=np.nan)),
+                           index=raw_scores_df.index, dtype=object)
+    # Per-participant diagnostics only when debug logging is on
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, age_to_ref, age_group in zip(raw_scores_df.index, raw_scores_df["AGE"], age_groups):
+            logger.debug("Reference table for %s with %s is: %s", i, age_to_ref, age_group)
 
-    - Initializes empty dataframe (df_gsv_scores)
+    # Make sure age is valid
+    no_band = age_groups.isna().to_numpy()
+    if no_band.any():
+        raw_scores_df.loc[no_band, 'age_validity'] = 'FIX AGE INPUT FOR ' + raw_scores_df.index[no_band].astype(str)
 
-    For both AC and EC:
-    - Reads in (ac/ec) gsv reference table (same as age equivalent tables)
-    - Takes participant's raw scores from raw_scores_df
-    - Using raw scores, finds corresponding GSV in age equivalent reference table
-    - Saves age equivalents in new dataframe: df_gsv_scores    
+    return age_groups
+
+
+def score_standard_scores(raw_scores_df, age_groups, norms):
+    '''
+    Purpose: Returns AC and EC Standard Scores and Percentile Ranks (and space for the totals)
+
+    - Groups participants by age band so each band's AC and EC reference tables are used once
+    - Using AC and EC raw scores, gathers the corresponding standard scores and percentile
+      ranks from the compiled (ac/ec) reference arrays in a single lookup per band
+    - Saves AC and EC standard scores and percentile rank in the preallocated score columns
+    '''
+    ac_raw_values = pd.to_numeric(raw_scores_df["AC Raw"], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    ec_raw_values = pd.to_numeric(raw_scores_df["EC Raw"], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+    # Preallocate one column per score, aligned with the rows of raw_scores_df
+    # (participants without a valid age band keep NaN standard scores)
+    n_rows = len(raw_scores_df)
+    scores = {col: np.full(n_rows, np.nan)
+              for col in ["AC_SS", "AC_Percentile_Rank", "EC_SS", "EC_Percentile_Rank"]}
+    scores.update({col: np.full(n_rows, np.nan, dtype=object)
+                   for col in ["Total Language Standard Score", "Total Language Percentile Rank"]})
+
+    for age_band, positions in age_groups.groupby(age_groups, sort=False).indices.items():
+        ac_ss, ac_pr = lookup_ss_pr(ac_raw_values[positions], norms.score_table('AC', age_band))
+        ec_ss, ec_pr = lookup_ss_pr(ec_raw_values[positions], norms.score_table('EC', age_band))
+        scores["AC_SS"][positions] = ac_ss
+        scores["AC_Percentile_Rank"][positions] = ac_pr
+        scores["EC_SS"][positions] = ec_ss
+        scores["EC_Percentile_Rank"][positions] = ec_pr
+
+    return scores
+
+
+def score_total_standard_scores(raw_scores_df, age_groups, scores, norms):
+    '''
+    Purpose: Fills in Total Language Standard Score and Percentile Rank from the AC and EC standard scores
     '''
+    # Everyone with a valid age band is looked up at once
+    has_band = age_groups.notna().to_numpy()
+    total_ss, total_pr, unmatched = lookup_total_ss(scores["AC_SS"][has_band], scores["EC_SS"][has_band],
+                                                    norms.total_ss_table())
+    scores["Total Language Standard Score"][has_band] = total_ss
+    scores["Total Language Percentile Rank"][has_band] = total_pr
+    if unmatched.any():
+        sum_ac_ec_ss = (scores["AC_SS"] + scores["EC_SS"])[has_band][unmatched]
+        logger.warning("No Total Standard Score range for AC_SS + EC_SS of %s - set to -999",
+                       ', '.join(f'{i} ({s:g})' for i, s in zip(raw_scores_df.index[has_band][unmatched], sum_ac_ec_ss)))
 
-    # Initialize empty dataframe for Growth Scale Values
-    df_gsv_scores = pd.DataFrame()
+    return scores
 
-    # Iterate over rows of the DataFrame
-    for i, row in raw_scores_df.iterrows():
-        # Extract AC and EC raw scores from the DataFrame
-        ac_raw = row["AC Raw"]
-        ec_raw = row["EC Raw"]
 
-        # Initialize AC and EC GSV
-        ac_gsv = -999
-        ec_gsv = -999
+def score_age_equivalents(raw_scores_df, scores, norms):
+    """
+    Purpose: Returns AC, EC and Total Language Age Equivalents in Years and Months, and AC and EC GSVs
+
+    - Takes participant's raw AC and EC scores from raw_scores_df, and calculates their sum (sum_ac_ec_raw)
+    - Using the raw scores (and their sum), looks up every participant at once in the compiled
+      A.4 (AC), A.5 (EC) and A.6 (Total) reference arrays
+    - Age equivalents come back in both years format (#y#m) and months format (##)
+    - GSVs come from the same A.4 and A.5 rows as the AC and EC age equivalents
+    """
+    ac_raw_values = pd.to_numeric(raw_scores_df["AC Raw"], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    ec_raw_values = pd.to_numeric(raw_scores_df["EC Raw"], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
 
-        if ac_raw != -999:
-            ac_match = ac_ae_ref_table.loc[ac_ae_ref_table.iloc[:, 0] == ac_raw]
-            if not ac_match.empty:
-                ac_gsv = ac_match.iloc[0, 2]
+    # AC and EC Age Equivalents and GSVs
+    scores["AC AE Years"], scores["AC AE Months"], scores["AC GSV"] = lookup_ae_gsv(
+        ac_raw_values, norms.ae_table('ac_ae'), 'ac_age_equivalent')
+    scores["EC AE Years"], scores["EC AE Months"], scores["EC GSV"] = lookup_ae_gsv(
+        ec_raw_values, norms.ae_table('ec_ae'), 'ec_age_equivalent')
 
-        if ec_raw != -999:
-            ec_match = ec_ae_ref_table.loc[ec_ae_ref_table.iloc[:, 0] == ec_raw]
-            if not ec_match.empty:
-                ec_gsv = ec_match.iloc[0, 2]
+    # Total Age Equivalents from the sum of the raw scores (-999 if either is missing)
+    sum_ac_ec_raw = np.where((ac_raw_values == -999) | (ec_raw_values == -999), -999, ac_raw_values + ec_raw_values)
+    scores["Total AE Years"], scores["Total AE Months"], _ = lookup_ae_gsv(
+        sum_ac_ec_raw, norms.ae_table('total_ae'), 'total_age_equivalent')
 
-        # Store GSVs in df_gsv_scores
-        df_gsv_scores.loc[i, "AC GSV"] = str(ac_gsv)
-        df_gsv_scores.loc[i, "EC GSV"] = str(ec_gsv)
+    return scores
 
-    # Merge all score dataframes together
-    dfs_to_merge = [raw_scores_df, df_ss_scores, df_total_lang_ss_scores,
-                    df_total_ae_scores, df_gsv_scores, df_ac_ec_ae_scores]
 
-    # Sequentially merge DataFrames
-    df_complete = raw_scores_df
-    for df in dfs_to_merge[1:]:
-        df_complete = df_complete.merge(df, left_index=True, right_index=True, how="left")
+def build_importable_frame(raw_scores_df, scores, id_column, event_name_column):
+    '''
+    Purpose: Combines the raw scores and all scores into the REDCap-importable frame
+    '''
+    # Build the complete frame once, aligned on the study_id index
+    df_complete = pd.concat([raw_scores_df, pd.DataFrame(scores, index=raw_scores_df.index)], axis=1)
 
     # Clean up the study id to take out the appended age value
-    df_complete.index = df_complete.index.str.split("-").str[0]
+    df_complete.index = df_complete.index.astype(str).str.split("-").str[0]
     df_complete.index = df_complete.index.rename("subject_id")
 
     # Rename columns
@@ -457,12 +390,188 @@ def pls_Scoring_Fcn(root_filepath, REDCap_raw_scores_file,
     # Create the final DataFrame by selecting only the desired columns
     df_final = df_complete[columns_to_include].copy()
 
-    # Save the final DataFrame
-    if file_ext == ".xlsx":
-        df_final.to_excel(f'{root_filepath}{output_file_location}/Importable_PLS_{datetime.datetime.now().date()}.xlsx')
-    elif file_ext == ".csv":
-        df_final.to_csv(f'{root_filepath}{output_file_location}/Importable_PLS_{datetime.datetime.now().date()}.csv')
-    
+    return df_final
+
+
+def score_raw_scores(raw_scores_df, norms, id_column, event_name_column, metrics=None):
+    '''
+    Purpose: Scores prepared raw scores against the norms store and returns the REDCap-ready frame
+
+    - metrics: optional ScoringMetrics that receives the time and row count of each stage
+    '''
+    if metrics is None:
+        metrics = ScoringMetrics()
+    rows = len(raw_scores_df)
+
+    with metrics.stage('age_bands', rows):
+        age_groups = assign_age_bands(raw_scores_df)
+    with metrics.stage('ss_pr', rows):
+        scores = score_standard_scores(raw_scores_df, age_groups, norms)
+    with metrics.stage('total_ss', rows):
+        scores = score_total_standard_scores(raw_scores_df, age_groups, scores, norms)
+    with metrics.stage('ae_gsv', rows):
+        scores = score_age_equivalents(raw_scores_df, scores, norms)
+    with metrics.stage('build', rows):
+        df_final = build_importable_frame(raw_scores_df, scores, id_column, event_name_column)
+    return df_final
+
+
+def pls_Scoring_Fcn(root_filepath, REDCap_raw_scores_file, 
+                    id_column, event_name_column, age_column, ac_column, ec_column, output_file_location,
+                    norms=None, chunksize=None, output_file_name=None, ledger_path=None,
+                    metrics=None, profile=None, output_format=None, on_invalid=None, trajectories=False,
+                    mirror_dir=None):
+    '''
+    Purpose: Scores a REDCap export of PLS raw scores and saves Importable_PLS_<date> for REDCap import
+
+    - norms: preloaded PLSNorms store (loaded from PLS_ref_materials if not given)
+    - chunksize: if set, streams a .csv export in chunks of at most this many rows, scoring each
+      chunk and appending it to the output, so memory stays flat; returns None instead of the frame
+    - output_file_name: name of the output file without extension (default Importable_PLS_<date>)
+    - ledger_path: optional SQLite ledger of scored visits; if given, only visits that are new or whose
+      age, raw scores or norms changed since they were last scored are scored and written out
+    - metrics: optional ScoringMetrics that receives wall time, row counts and norms-cache hits per stage
+    - profile: opt-in profiler around the scoring core (True, a .prof file path or a profiler context manager)
+    - output_format: 'csv', 'xlsx' or 'parquet' (default: the same format as the export)
+    - on_invalid: validate the whole export before scoring (see PLS_validation) and save the problems
+      to <output_file_name>_errors.csv; 'raise' stops with a ValidationError before anything is scored,
+      'skip' scores only the rows without problems (default None: no validation pass)
+    - trajectories: also save <output_file_name>_trajectories with every subject's GSV change and AE gaps
+      across visits (see PLS_longitudinal); needs every visit to be scored, so it cannot be combined
+      with ledger_path
+    - mirror_dir: read the reference workbooks from a local copy kept in this folder instead of
+      root_filepath, e.g. PLS_mirror.DEFAULT_MIRROR_DIR when root_filepath is a network share
+    '''
+    if on_invalid not in (None, 'raise', 'skip'):
+        raise ValueError(f"on_invalid must be None, 'raise' or 'skip', not {on_invalid!r}")
+    if trajectories and ledger_path is not None:
+        # The ledger leaves out visits scored in earlier runs, which would skew visit numbers and deltas
+        raise ValueError("trajectories need every visit of every subject and cannot be combined with ledger_path")
+    if metrics is None:
+        metrics = ScoringMetrics()
+
+    # load every reference table once (from the local norms cache when the workbooks are unchanged)
+    if norms is None:
+        with metrics.stage('norms'):
+            if mirror_dir is not None:
+                norms = load_mirrored_norms(root_filepath + REF_MATERIALS_DIR, mirror_dir)
+            else:
+                norms = load_norms(root_filepath + REF_MATERIALS_DIR)
+    metrics.record_norms(norms)
+
+    columns = (id_column, event_name_column, age_column, ac_column, ec_column)
+    if output_format is None:
+        output_format = output_format_for(REDCap_raw_scores_file)
+    if output_file_name is None:
+        output_file_name = f'Importable_PLS_{datetime.datetime.now().date()}'
+    writer = open_writer(f'{root_filepath}{output_file_location}/{output_file_name}', output_format)
+
+    # Incremental mode: skip visits the ledger says were already scored with the same inputs
+    ledger = open_ledger(ledger_path) if ledger_path is not None else None
+
+    def only_unscored(raw_scores_df):
+        if ledger is None:
+            return raw_scores_df
+        with metrics.stage('ledger', len(raw_scores_df)):
+            return raw_scores_df[unscored_rows(ledger, raw_scores_df, norms.version)]
+
+    # Keys of the visits scored in this run; they go into the ledger only once the output file is complete
+    scored_keys = []
+
+    def record(raw_scores_df):
+        if ledger is not None:
+            with metrics.stage('ledger', len(raw_scores_df)):
+                scored_keys.append(visit_keys(raw_scores_df))
+
+    def check(report):
+        # Save the error report, then stop ('raise') or return the export rows to leave out ('skip')
+        if len(report) == 0:
+            return pd.Index([])
+        report_path = f'{root_filepath}{output_file_location}/{output_file_name}_errors.csv'
+        report.to_csv(report_path, index=False)
+        message = (f"{report['row'].nunique()} invalid rows in {REDCap_raw_scores_file} "
+                   f"({summarize(report)}), see {report_path}")
+        if on_invalid == 'raise':
+            raise ValidationError(message, report)
+        logger.warning("skipping %s", message)
+        return pd.Index(report['row'].unique())
+
+    # Per-visit inputs to the trajectories, collected from every scored chunk
+    trajectory_parts = []
+
+    df_final = None
+    with profiling(profile):
+        # Streaming mode: score and append one chunk at a time
+        if chunksize is not None:
+            invalid_rows = pd.Index([])
+            if on_invalid is not None:
+                # One validation pass over the whole export before the first chunk is scored
+                with metrics.stage('validate'):
+                    invalid_rows = check(validate_export(
+                        read_raw_scores(root_filepath + REDCap_raw_scores_file, columns, chunksize=chunksize),
+                        columns, norms))
+
+            chunks = read_raw_scores(root_filepath + REDCap_raw_scores_file, columns, chunksize=chunksize)
+            start = time.perf_counter()
+            for raw_scores_chunk in chunks:
+                raw_scores_chunk = raw_scores_chunk[~raw_scores_chunk.index.isin(invalid_rows)]
+                raw_scores_chunk = prepare_raw_scores(raw_scores_chunk, columns)
+                metrics.add('ingest', time.perf_counter() - start, len(raw_scores_chunk))
+
+                raw_scores_chunk = only_unscored(raw_scores_chunk)
+                df_chunk = score_raw_scores(raw_scores_chunk, norms, id_column, event_name_column, metrics)
+                with metrics.stage('write', len(df_chunk)):
+                    writer.write(df_chunk)
+                if trajectories:
+                    trajectory_parts.append(trajectory_inputs(df_chunk, raw_scores_chunk))
+                record(raw_scores_chunk)
+                start = time.perf_counter()
+
+        else:
+            # import the REDCap raw scores
+            start = time.perf_counter()
+            raw_scores_df = read_raw_scores(root_filepath + REDCap_raw_scores_file, columns)
+            if on_invalid is not None:
+                metrics.add('ingest', time.perf_counter() - start)
+                with metrics.stage('validate', len(raw_scores_df)):
+                    invalid_rows = check(validate_raw_scores(raw_scores_df, columns, norms))
+                raw_scores_df = raw_scores_df[~raw_scores_df.index.isin(invalid_rows)]
+                start = time.perf_counter()
+            raw_scores_df = prepare_raw_scores(raw_scores_df, columns)
+            metrics.add('ingest', time.perf_counter() - start, len(raw_scores_df))
+
+            raw_scores_df = only_unscored(raw_scores_df)
+            df_final = score_raw_scores(raw_scores_df, norms, id_column, event_name_column, metrics)
+
+            # Save the final DataFrame
+            with metrics.stage('write', len(df_final)):
+                writer.write(df_final)
+            if trajectories:
+                trajectory_parts.append(trajectory_inputs(df_final, raw_scores_df))
+            record(raw_scores_df)
+
+        # Finish the output file (the XLSX and Parquet writers only complete the file here)
+        with metrics.stage('write'):
+            writer.close()
+        if scored_keys:
+            with metrics.stage('ledger'):
+                record_scored(ledger, pd.concat(scored_keys), norms.version)
+
+        # Longitudinal outputs, once every visit of every subject has been scored
+        if trajectories and trajectory_parts:
+            with metrics.stage('trajectories'):
+                df_trajectories = compute_trajectories(pd.concat(trajectory_parts))
+                trajectory_writer = open_writer(
+                    f'{root_filepath}{output_file_location}/{output_file_name}_trajectories', output_format)
+                trajectory_writer.write(df_trajectories)
+                trajectory_writer.close()
+
+    if ledger is not None:
+        ledger.close()
+    logger.info("scored in %.2fs: %s", metrics.total_seconds,
+                ', '.join(f"{name} {stage['seconds']:.3f}s" for name, stage in metrics.stages.items()),
+                extra={'metrics': metrics.as_dict()})
+
     print("PLS Auto-Scoring Complete!")
     
-    return df_final
\ No newline at end of file
+    return df_final
@@ -1,7 +1,9 @@
 # CREATORS: Michael Khela and Shefali Verma
 # PURPOSE: For more details, see the PLS Automation Protocol
+#          Needs the PLS scripts installed once (pip install <PLS_Background_code folder>), which also
+#          provides the same run as a command: pls-score --root <root_filepath> --input <export>
 
-import sys
+from PLS_cli import main
 
 # USER INPUTS #
 
@@ -22,10 +24,8 @@ ec_column = "pls_exp_comm_raw"
 REDCap_raw_scores_file = ("Assessment_Packages/PLS_package/PLS_inputs/" + REDCap_filepath)
 
 # DO NOT EDIT BELOW ------------------------------------------------
-sys.path.append(root_filepath + 'Assessment_Packages/PLS_package/PLS_Background_code/')
-from BRIDGE_PLS import pls_Scoring_Fcn
-
-pls_Scoring_Fcn(root_filepath, REDCap_raw_scores_file, 
-                   id_column, 
-                   event_name_column,
-                   age_column, ac_column, ec_column, output_file_location)
\ No newline at end of file
+# The reference workbooks are read from a local mirror of the share (see PLS_mirror)
+main(['--root', root_filepath, '--input', REDCap_raw_scores_file,
+      '--output-dir', output_file_location.rstrip('/'),
+      '--id-column', id_column, '--event-column', event_name_column, '--age-column', age_column,
+      '--ac-column', ac_column, '--ec-column', ec_column, '--mirror'])
@@ -0,0 +1,163 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Scores many REDCap exports in one run across a pool of worker processes.
+#          The norms are loaded once in the parent process and shared with the workers.
+
+import os
+import glob
+import itertools
+import collections
+import datetime
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from BRIDGE_PLS import pls_Scoring_Fcn
+from PLS_writers import open_writer, output_format_for
+from PLS_norms import load_norms, REF_MATERIALS_DIR
+from PLS_mirror import load_mirrored_norms, wait_for_mirror
+
+# Norms store of the current worker process, set once by _init_worker
+_worker_norms = None
+
+
+def _init_worker(norms):
+    # With fork the store is inherited from the parent; with spawn it is sent once per worker
+    global _worker_norms
+    _worker_norms = norms
+
+
+def _score_one_file(root_filepath, REDCap_raw_scores_file, columns, output_file_location, output_file_name,
+                    output_format=None, return_frame=False):
+    '''
+    Scores a single export in a worker. Returns (file, df_final, None) on success or
+    (file, None, error message) on failure, so one bad file never stops the batch.
+
+    - return_frame: send df_final back to the parent process; otherwise it is None, so the scored
+      frame is not pickled across processes when nothing needs it
+    '''
+    id_column, event_name_column, age_column, ac_column, ec_column = columns
+    try:
+        df_final = pls_Scoring_Fcn(root_filepath, REDCap_raw_scores_file,
+                                   id_column, event_name_column, age_column, ac_column, ec_column,
+                                   output_file_location, norms=_worker_norms, output_file_name=output_file_name,
+                                   output_format=output_format)
+        return REDCap_raw_scores_file, df_final if return_frame else None, None
+    except Exception:
+        return REDCap_raw_scores_file, None, traceback.format_exc()
+
+
+def find_exports(root_filepath, inputs):
+    '''
+    Returns the exports to score, relative to root_filepath
+
+    - inputs: a folder (every .csv/.xlsx in it) or a glob pattern such as 'PLS_inputs/site_*.csv'
+    '''
+    if os.path.isdir(os.path.join(root_filepath, inputs)):
+        patterns = [os.path.join(inputs, '*.csv'), os.path.join(inputs, '*.xlsx')]
+    else:
+        patterns = [inputs]
+
+    exports = []
+    for pattern in patterns:
+        exports.extend(glob.glob(pattern, root_dir=root_filepath or None))
+    return sorted(path.replace(os.sep, '/') for path in exports if path[-4:] in ('.csv', 'xlsx'))
+
+
+def export_names(root_filepath, inputs, exports):
+    '''
+    Returns the name each export's output file is built from: its path relative to inputs (the folder,
+    or the part of the glob pattern before the first wildcard) without extension, '/' replaced by '_'
+
+    - 'sites/*/export.csv' gives 'a_export' and 'b_export' for sites/a/export.csv and sites/b/export.csv
+    '''
+    if os.path.isdir(os.path.join(root_filepath, inputs)):
+        base = inputs
+    else:
+        parts = inputs.replace(os.sep, '/').split('/')
+        fixed = list(itertools.takewhile(lambda part: not glob.has_magic(part), parts[:-1]))
+        base = '/'.join(fixed)
+    return [os.path.splitext(os.path.relpath(export, base or '.'))[0].replace(os.sep, '/').replace('/', '_')
+            for export in exports]
+
+
+def pls_Batch_Scoring_Fcn(root_filepath, inputs,
+                          id_column, event_name_column, age_column, ac_column, ec_column, output_file_location,
+                          merged_output=False, max_workers=None, norms=None, output_format=None,
+                          mirror_dir=None):
+    '''
+    Purpose: Scores every export matching inputs in parallel
+
+    - inputs: folder or glob pattern of REDCap exports, relative to root_filepath
+    - Loads the norms once here; worker processes reuse them instead of reading the workbooks again
+    - mirror_dir: load the norms from a local copy of the reference workbooks (see PLS_mirror); the
+      workers start once any fetch left running in the background has finished
+    - Writes Importable_PLS_<export name>_<date> for each export (see export_names); raises ValueError
+      before scoring anything if two exports would write the same output file
+    - output_format: 'csv', 'xlsx' or 'parquet' for every output (default: the format of each export)
+    - merged_output: also writes every scored row to Importable_PLS_merged_<date> in output_format
+      (CSV when output_format is not given, as the exports may be in different formats)
+    - Failed exports are reported at the end without stopping the others
+    - Returns a dict of export -> scored DataFrame (None for exports that failed); the scored frames
+      are only sent back from the workers with merged_output, otherwise every value is None
+    '''
+    if norms is None and mirror_dir is not None:
+        norms = load_mirrored_norms(root_filepath + REF_MATERIALS_DIR, mirror_dir)
+    elif norms is None:
+        norms = load_norms(root_filepath + REF_MATERIALS_DIR)
+    # Compile every lookup table before the workers start so none of them repeats the work
+    norms.compile_all()
+
+    exports = find_exports(root_filepath, inputs)
+    if not exports:
+        print("No REDCap exports found for", inputs)
+        return {}
+
+    columns = (id_column, event_name_column, age_column, ac_column, ec_column)
+    today = datetime.datetime.now().date()
+
+    # Refuse exports that would overwrite each other's output (e.g. a.csv and a.csv in two folders)
+    names = export_names(root_filepath, inputs, exports)
+    outputs = collections.defaultdict(list)
+    for export, export_name in zip(exports, names):
+        outputs[export_name, output_format or output_format_for(export)].append(export)
+    clashes = [exports_for_name for exports_for_name in outputs.values() if len(exports_for_name) > 1]
+    if clashes:
+        raise ValueError("These exports would write the same output file: "
+                         + '; '.join(', '.join(exports_for_name) for exports_for_name in clashes))
+
+    # Prefer fork so workers share the parent's norms pages instead of receiving a copy. Forking while a
+    # mirror fetch thread runs can deadlock a worker, so wait for the fetch to finish first.
+    start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+    if start_method == 'fork':
+        wait_for_mirror()
+    mp_context = multiprocessing.get_context(start_method)
+
+    results = {}
+    failures = {}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context,
+                             initializer=_init_worker, initargs=(norms,)) as pool:
+        futures = []
+        for export, export_name in zip(exports, names):
+            futures.append(pool.submit(_score_one_file, root_filepath, export, columns,
+                                       output_file_location, f'Importable_PLS_{export_name}_{today}', output_format,
+                                       merged_output))
+        for future in futures:
+            export, df_final, error = future.result()
+            results[export] = df_final
+            if error is not None:
+                failures[export] = error
+
+    if merged_output:
+        scored = [df for df in results.values() if df is not None]
+        if scored:
+            writer = open_writer(f'{root_filepath}{output_file_location}/Importable_PLS_merged_{today}',
+                                 output_format or 'csv')
+            for df_final in scored:
+                writer.write(df_final)
+            writer.close()
+
+    print(f"Scored {len(exports) - len(failures)} of {len(exports)} exports")
+    for export, error in failures.items():
+        print(f"FAILED: {export}\n{error}")
+
+    return results
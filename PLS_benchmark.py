@@ -0,0 +1,200 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Benchmarks pls_Scoring_Fcn stage by stage on synthetic data, so it can be run
+#          without the private PLS_ref_materials workbooks and compared across commits.
+#
+# Usage: python PLS_benchmark.py --sizes 100 10000 1000000 --output bench.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+import BRIDGE_PLS
+from PLS_metrics import ScoringMetrics
+from PLS_norms import (load_norms, AGE_BAND_SHEETS, AGE_BAND_MONTHS, REF_MATERIALS_DIR, AC_SCORES_FILE,
+                       EC_SCORES_FILE, TOTAL_SS_FILE, AC_AE_FILE, EC_AE_FILE, TOTAL_AE_FILE)
+
+COLUMNS = ('subject_id', 'redcap_event_name', 'chron_age_pls', 'pls_aud_comp_raw', 'pls_exp_comm_raw')
+
+# Highest raw score in the synthetic AC and EC tables
+MAX_RAW = 62
+
+
+def _age_equivalent(raw, top):
+    # '<y-m' for the lowest raw score, '>y-m' for the highest, 'y-m' otherwise
+    years, months = divmod(3 + raw * 2, 12)
+    prefix = '<' if raw == 0 else '>' if raw == top else ''
+    return f'{prefix}{years}-{months}'
+
+
+def make_synthetic_norms(ref_dir, seed=0):
+    '''
+    Purpose: Writes synthetic A.1 - A.6 workbooks shaped like the real reference materials
+
+    - A.1 / A.2: one sheet per age band, no header, first row is a 'lo-hi' floor row
+    - A.3: 'lo-hi' ranges of AC_SS + EC_SS (plus a single value on the last row), no header
+    - A.4 / A.5 / A.6: header row, raw score, '[<>]y-m' age equivalent and GSV columns
+    '''
+    rng = np.random.default_rng(seed)
+    os.makedirs(ref_dir, exist_ok=True)
+
+    for file_name in [AC_SCORES_FILE, EC_SCORES_FILE]:
+        with pd.ExcelWriter(os.path.join(ref_dir, file_name)) as writer:
+            for band_number, sheet in enumerate(AGE_BAND_SHEETS):
+                floor = 3 + band_number
+                rows = [[f'0-{floor - 1}', 50, 1]]
+                for raw in range(floor, MAX_RAW):
+                    rows.append([raw, min(150, 50 + (raw - floor) * 2 + int(rng.integers(0, 3))),
+                                 min(99, 1 + raw - floor)])
+                pd.DataFrame(rows).to_excel(writer, sheet_name=sheet, header=False, index=False)
+
+    rows = []
+    lower = 100
+    for total_ss in range(50, 151):
+        rows.append([f'{lower}-{lower + 1}', total_ss, min(99, max(1, total_ss - 50))])
+        lower += 2
+    rows.append([str(lower), 151, 99])
+    pd.DataFrame(rows).to_excel(os.path.join(ref_dir, TOTAL_SS_FILE), header=False, index=False)
+
+    for file_name, top in [(AC_AE_FILE, MAX_RAW), (EC_AE_FILE, MAX_RAW), (TOTAL_AE_FILE, 2 * MAX_RAW)]:
+        pd.DataFrame({
+            'Raw Score': range(top + 1),
+            'Age Equivalent': [_age_equivalent(raw, top) for raw in range(top + 1)],
+            'GSV': [200 + raw * 3 for raw in range(top + 1)],
+        }).to_excel(os.path.join(ref_dir, file_name), index=False)
+
+
+def make_synthetic_export(path, n_rows, seed=0, extra_columns=20, missing_rate=0.05):
+    '''
+    Purpose: Writes a REDCap-style raw data export with n_rows visits
+
+    - Ages are a mix of #y#m, y:m and y.m formats within the PLS age range
+    - About missing_rate of the AC and EC raw scores are the -999 sentinel
+    - extra_columns unrelated columns make the export wide like a full project export
+    '''
+    rng = np.random.default_rng(seed)
+    first_month, _ = AGE_BAND_MONTHS[AGE_BAND_SHEETS[0]]
+    _, last_month = AGE_BAND_MONTHS[AGE_BAND_SHEETS[-1]]
+    age_months = rng.integers(max(first_month, 1), last_month + 1, n_rows)
+    years = pd.Series(age_months // 12).astype(str)
+    months = pd.Series(age_months % 12).astype(str)
+    age_format = rng.integers(0, 3, n_rows)
+    ages = np.where(age_format == 0, years + 'y' + months + 'm',
+                    np.where(age_format == 1, years + ':' + months, years + '.' + months))
+
+    def raw_scores():
+        raw = rng.integers(0, MAX_RAW, n_rows)
+        return np.where(rng.random(n_rows) < missing_rate, -999, raw)
+
+    export = {
+        'subject_id': pd.Series(np.arange(n_rows)).map('S{:07d}'.format),
+        'redcap_event_name': rng.choice(['visit_1_arm_1', 'visit_2_arm_1', 'visit_3_arm_1'], n_rows),
+        'chron_age_pls': ages,
+        'pls_aud_comp_raw': raw_scores(),
+        'pls_exp_comm_raw': raw_scores(),
+    }
+    for column_number in range(extra_columns):
+        export[f'other_field_{column_number}'] = rng.integers(0, 100, n_rows)
+    pd.DataFrame(export).to_csv(path, index=False)
+
+
+def benchmark_export(root_filepath, export_file, norms, output_file_location):
+    '''
+    Purpose: Runs the scoring stages on one export and returns their wall times
+    '''
+    metrics = ScoringMetrics()
+    columns = COLUMNS
+    with metrics.stage('ingest'):
+        raw_scores_df = BRIDGE_PLS.read_raw_scores(root_filepath + export_file, columns)
+        raw_scores_df = BRIDGE_PLS.prepare_raw_scores(raw_scores_df, columns)
+    df_final = BRIDGE_PLS.score_raw_scores(raw_scores_df, norms, columns[0], columns[1], metrics)
+    with metrics.stage('write'):
+        df_final.to_csv(f'{root_filepath}{output_file_location}/Importable_PLS_benchmark.csv')
+
+    stages = {name: stage['seconds'] for name, stage in metrics.stages.items()}
+    stages['total'] = metrics.total_seconds
+    return {'rows': len(raw_scores_df), 'stages': stages}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(sizes, workdir, repeat=1, seed=0):
+    '''
+    Purpose: Benchmarks norms loading and every scoring stage for each export size
+
+    - Builds the synthetic workbooks and exports under workdir
+    - Times the first (Excel parse) and a cached load of the norms
+    - Returns a JSON-serialisable dict with the best time of each stage over repeat runs
+    '''
+    root_filepath = os.path.join(workdir, '')
+    ref_dir = root_filepath + REF_MATERIALS_DIR
+    cache_dir = os.path.join(workdir, 'norms_cache')
+    output_file_location = 'PLS'
+    os.makedirs(root_filepath + output_file_location, exist_ok=True)
+    make_synthetic_norms(ref_dir, seed=seed)
+
+    start = time.perf_counter()
+    load_norms(ref_dir, cache_dir=cache_dir)
+    norms_cold = time.perf_counter() - start
+    start = time.perf_counter()
+    norms = load_norms(ref_dir, cache_dir=cache_dir)
+    norms_warm = time.perf_counter() - start
+
+    results = []
+    for n_rows in sizes:
+        export_file = f'export_{n_rows}.csv'
+        make_synthetic_export(root_filepath + export_file, n_rows, seed=seed)
+        runs = [benchmark_export(root_filepath, export_file, norms, output_file_location) for _ in range(repeat)]
+        best = {stage: min(run['stages'][stage] for run in runs) for stage in runs[0]['stages']}
+        results.append({'rows': n_rows, 'scored_rows': runs[0]['rows'], 'stages': best})
+        print(f"{n_rows:>9} rows: " + ', '.join(f'{stage} {seconds:.3f}s' for stage, seconds in best.items()))
+
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'repeat': repeat,
+        'norms_load': {'cold': norms_cold, 'warm': norms_warm},
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PLS scoring on synthetic data')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='number of rows of each synthetic export (default: 100 1000 10000 100000)')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per size, the best time is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='folder for the synthetic files (default: a temporary folder)')
+    parser.add_argument('--output', default='PLS_benchmark.json', help='where to save the JSON results')
+    args = parser.parse_args(argv)
+
+    if args.workdir:
+        report = run_benchmark(args.sizes, args.workdir, repeat=args.repeat, seed=args.seed)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            report = run_benchmark(args.sizes, workdir, repeat=args.repeat, seed=args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Benchmark results saved to", args.output)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Command-line entry point (pls-score) for scoring a REDCap export. Column names, input and
+#          output come from arguments or a config file. pandas and the scoring modules are imported
+#          only once scoring starts, so --dry-run checks a job without loading them at all.
+#
+# Usage: pls-score --root <Automated_Assessments folder> --input <export .csv> [--config pls.toml]
+#        pls-score --config pls.toml --dry-run
+
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+
+from PLS_paths import REF_MATERIALS_DIR, DEFAULT_MIRROR_DIR, REF_WORKBOOKS
+
+# Settings a config file (or the command line) can give, with their defaults
+DEFAULTS = {
+    'root': '',
+    'input': None,
+    'output_dir': 'PLS',
+    'output_name': None,
+    'format': None,
+    'id_column': 'subject_id',
+    'event_column': 'redcap_event_name',
+    'age_column': 'chron_age_pls',
+    'ac_column': 'pls_aud_comp_raw',
+    'ec_column': 'pls_exp_comm_raw',
+    'chunksize': None,
+    'ledger': None,
+    'on_invalid': None,
+    'trajectories': False,
+    'mirror': None,
+}
+
+
+def read_config(path):
+    '''
+    Purpose: Reads settings from a .toml or .json config file (keys as in DEFAULTS)
+
+    - A TOML file may keep the settings at the top level or under a [pls] table
+    '''
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML config files need Python 3.11 or later, use a .json config instead") from None
+        with open(path, 'rb') as f:
+            config = tomllib.load(f)
+    else:
+        with open(path) as f:
+            config = json.load(f)
+    config = config.get('pls', config)
+
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+    return config
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pls-score', description='Score a REDCap export of PLS raw scores')
+    parser.add_argument('--config', help='.toml or .json file with any of the settings below')
+    parser.add_argument('--root', help='folder containing Assessment_Packages/ (root_filepath)')
+    parser.add_argument('--input', help='REDCap export (.csv or .xlsx), relative to --root')
+    parser.add_argument('--output-dir', help='output folder, relative to --root (default: PLS)')
+    parser.add_argument('--output-name', help='output file name without extension (default: Importable_PLS_<date>)')
+    parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], help='output format (default: as the input)')
+    parser.add_argument('--id-column')
+    parser.add_argument('--event-column')
+    parser.add_argument('--age-column')
+    parser.add_argument('--ac-column')
+    parser.add_argument('--ec-column')
+    parser.add_argument('--chunksize', type=int, help='stream a .csv export this many rows at a time')
+    parser.add_argument('--ledger', help='SQLite ledger file for incremental scoring')
+    parser.add_argument('--on-invalid', choices=['raise', 'skip'], help='validate the export before scoring')
+    parser.add_argument('--trajectories', action='store_true', default=None,
+                        help='also save per-subject trajectories across visits')
+    parser.add_argument('--mirror', nargs='?', const='default',
+                        help='read the reference workbooks from a local mirror (optionally its folder)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='check the paths and the export header without scoring anything')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the stage timings')
+    return parser
+
+
+def resolve_settings(args):
+    # Defaults, then the config file, then the command line
+    settings = dict(DEFAULTS)
+    if args.config:
+        settings.update(read_config(args.config))
+    settings.update({key: value for key, value in vars(args).items() if key in DEFAULTS and value is not None})
+
+    root = settings['root']
+    if root and not root.endswith(('/', '\\')):
+        settings['root'] = root + '/'
+    # mirror = true in a config file means the default mirror folder
+    if settings['mirror'] is True or settings['mirror'] == 'default':
+        settings['mirror'] = DEFAULT_MIRROR_DIR
+    elif settings['mirror'] is False:
+        settings['mirror'] = None
+
+    if settings['input'] is None:
+        raise ValueError("No input export given (--input or 'input' in the config file)")
+    if settings['format'] not in (None, 'csv', 'xlsx', 'parquet'):
+        raise ValueError(f"format must be csv, xlsx or parquet, not {settings['format']!r}")
+    if settings['on_invalid'] not in (None, 'raise', 'skip'):
+        raise ValueError(f"on_invalid must be raise or skip, not {settings['on_invalid']!r}")
+    if settings['trajectories'] and settings['ledger'] is not None:
+        raise ValueError("trajectories need every visit to be scored and cannot be combined with a ledger")
+    return settings
+
+
+def _read_header(path):
+    # Column names of the export: csv module for .csv, openpyxl (read-only) for .xlsx
+    if path.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            first_row = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [str(value) for value in first_row if value is not None]
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), [])
+
+
+def dry_run(settings):
+    '''
+    Purpose: Checks a scoring job without importing pandas or scoring anything; returns the problems found
+
+    - The export exists, is a .csv or .xlsx file and has the five configured columns
+    - The reference workbooks exist (on the share, or in the local mirror)
+    - The output and ledger folders exist
+    '''
+    root = settings['root']
+    problems = []
+    input_path = root + settings['input']
+    columns = [settings[key] for key in ['id_column', 'event_column', 'age_column', 'ac_column', 'ec_column']]
+
+    if not os.path.isfile(input_path):
+        problems.append(f"export not found: {input_path}")
+    elif os.path.splitext(input_path)[1].lower() not in ('.csv', '.xlsx'):
+        problems.append(f"export must be a .csv or .xlsx file: {input_path}")
+    else:
+        header = _read_header(input_path)
+        missing = [column for column in columns if column not in header]
+        if missing:
+            problems.append(f"columns missing from {input_path}: {', '.join(missing)}")
+        if settings['chunksize'] is not None and input_path.lower().endswith('.xlsx'):
+            problems.append("chunksize needs a .csv export")
+
+    ref_dir = root + REF_MATERIALS_DIR
+    missing_workbooks = [name for name in REF_WORKBOOKS if not os.path.isfile(os.path.join(ref_dir, name))]
+    if missing_workbooks and settings['mirror'] is not None:
+        # The local mirror can stand in for a share that is unavailable
+        missing_workbooks = [name for name in missing_workbooks
+                             if not os.path.isfile(os.path.join(settings['mirror'], name))]
+    if missing_workbooks:
+        problems.append(f"reference workbooks missing from {ref_dir}: {', '.join(missing_workbooks)}")
+
+    output_dir = root + settings['output_dir']
+    if not os.path.isdir(output_dir):
+        problems.append(f"output folder not found: {output_dir}")
+    if settings['ledger'] is not None and not os.path.isdir(os.path.dirname(os.path.abspath(settings['ledger']))):
+        problems.append(f"ledger folder not found: {settings['ledger']}")
+    return problems
+
+
+def score(settings, verbose=False):
+    # The scoring stack (pandas, NumPy) is only imported here
+    from BRIDGE_PLS import pls_Scoring_Fcn
+
+    if verbose:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    pls_Scoring_Fcn(settings['root'], settings['input'],
+                    settings['id_column'], settings['event_column'], settings['age_column'],
+                    settings['ac_column'], settings['ec_column'], settings['output_dir'],
+                    chunksize=settings['chunksize'], output_file_name=settings['output_name'],
+                    ledger_path=settings['ledger'], output_format=settings['format'],
+                    on_invalid=settings['on_invalid'], trajectories=settings['trajectories'],
+                    mirror_dir=settings['mirror'])
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        settings = resolve_settings(args)
+    except (OSError, ValueError) as exc:
+        print(f"pls-score: {exc}", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        problems = dry_run(settings)
+        for problem in problems:
+            print("PROBLEM:", problem)
+        print("Dry run OK, ready to score" if not problems else f"Dry run found {len(problems)} problem(s)")
+        return 1 if problems else 0
+
+    score(settings, verbose=args.verbose)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
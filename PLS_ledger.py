@@ -0,0 +1,92 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Keeps an on-disk (SQLite) ledger of visits that were already scored, so a run
+#          only needs to score visits that are new or whose inputs or norms changed.
+
+import sqlite3
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+def open_ledger(ledger_path):
+    # Creates the ledger table on first use
+    connection = sqlite3.connect(ledger_path)
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS scored_visits (
+            subject_id TEXT NOT NULL,
+            redcap_event_name TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            norms_version TEXT NOT NULL,
+            scored_at TEXT NOT NULL,
+            PRIMARY KEY (subject_id, redcap_event_name)
+        )
+    ''')
+    return connection
+
+
+def visit_keys(raw_scores_df):
+    '''
+    Returns the (subject_id, redcap_event_name) key and the input fingerprint of each prepared row
+
+    - subject_id is the full subject ID (the "id" column of prepare_raw_scores), so IDs that
+      contain '-' such as BR-1 and BR-2 stay separate visits
+    - The fingerprint hashes the age, AC raw and EC raw scores of the visit
+    '''
+    keys = pd.DataFrame({
+        'subject_id': raw_scores_df['id'].astype(str).to_numpy(),
+        'redcap_event_name': raw_scores_df['Event Name'].astype(str).to_numpy(),
+    })
+    inputs = pd.DataFrame({
+        'age': raw_scores_df['AGE'].astype(str).to_numpy(),
+        # As float text so the fingerprint does not depend on the dtype the scores were read with
+        'ac_raw': raw_scores_df['AC Raw'].astype(float).astype(str).to_numpy(),
+        'ec_raw': raw_scores_df['EC Raw'].astype(float).astype(str).to_numpy(),
+    })
+    keys['fingerprint'] = pd.util.hash_pandas_object(inputs, index=False).map('{:016x}'.format).to_numpy()
+    return keys
+
+
+def unscored_rows(connection, raw_scores_df, norms_version):
+    '''
+    Purpose: Returns a boolean mask of the rows that still need scoring
+
+    - A row needs scoring if its visit is not in the ledger, its fingerprint changed,
+      or it was scored with a different version of the norms
+    - The rows' keys are joined against the ledger inside SQLite (on its primary key), so each chunk
+      only reads the ledger entries of its own visits rather than the whole table
+    '''
+    keys = visit_keys(raw_scores_df)
+    with connection:
+        connection.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS chunk_keys (
+                row INTEGER PRIMARY KEY,
+                subject_id TEXT NOT NULL,
+                redcap_event_name TEXT NOT NULL,
+                fingerprint TEXT NOT NULL
+            )
+        ''')
+        connection.execute('DELETE FROM chunk_keys')
+        connection.executemany('INSERT INTO chunk_keys VALUES (?, ?, ?, ?)',
+                               zip(range(len(keys)), keys['subject_id'], keys['redcap_event_name'],
+                                   keys['fingerprint']))
+        unchanged = connection.execute('''
+            SELECT chunk_keys.row FROM chunk_keys
+            JOIN scored_visits USING (subject_id, redcap_event_name)
+            WHERE scored_visits.fingerprint = chunk_keys.fingerprint AND scored_visits.norms_version = ?
+        ''', (norms_version,)).fetchall()
+
+    needs_scoring = np.ones(len(keys), dtype=bool)
+    needs_scoring[[row for row, in unchanged]] = False
+    return needs_scoring
+
+
+def record_scored(connection, keys, norms_version):
+    # Adds or updates the ledger entries of visits (visit_keys frames) whose output was written out
+    scored_at = datetime.datetime.now().isoformat(timespec='seconds')
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO scored_visits VALUES (?, ?, ?, ?, ?)',
+            [(subject_id, event, fingerprint, norms_version, scored_at)
+             for subject_id, event, fingerprint in keys.itertuples(index=False)]
+        )
@@ -0,0 +1,67 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Per-subject change across visits, computed from the already-scored frame: GSV change
+#          between consecutive visits, GSV change per month of age and AE vs chronological age gaps.
+
+import numpy as np
+import pandas as pd
+
+# Scored age-equivalent columns (in months) and their names in the trajectories
+AE_MONTH_COLUMNS = {
+    'pls_aud_comp_ae_m': 'ac_ae_months',
+    'pls_exp_comm_ae_m': 'ec_ae_months',
+    'pls_total_ae_m': 'total_ae_months',
+}
+
+
+def _numeric_scores(values):
+    # Scores as numbers; the -999 code and bounded age equivalents ('<9', '>95') become NaN
+    values = pd.to_numeric(pd.Series(values).astype(str), errors='coerce').to_numpy(dtype=float)
+    return np.where(values == -999, np.nan, values)
+
+
+def trajectory_inputs(df_final, raw_scores_df):
+    '''
+    Purpose: Returns the few columns of a scored frame that trajectories need, one row per visit
+
+    - df_final: frame returned by score_raw_scores
+    - raw_scores_df: the prepared raw scores df_final was scored from (see prepare_raw_scores), for
+      each row's full subject ID ("id") and chronological age in months ("AGE Months"); the scored
+      frame only has the subject ID cut at its first '-' and carries the age inside the study ID
+    - Small enough to collect across the chunks of a streamed run
+    '''
+    inputs = pd.DataFrame({
+        'redcap_event_name': df_final['redcap_event_name'].astype(object).to_numpy(),
+        'age_months': pd.to_numeric(raw_scores_df['AGE Months']).to_numpy(dtype=float, na_value=np.nan),
+        'gsv_ac': _numeric_scores(df_final['pls_gsv_ac']),
+        'gsv_ec': _numeric_scores(df_final['pls_gsv_ec']),
+    }, index=pd.Index(raw_scores_df['id'].to_numpy(), name='subject_id'))
+    for column, ae_column in AE_MONTH_COLUMNS.items():
+        inputs[ae_column] = _numeric_scores(df_final[column])
+    return inputs
+
+
+def compute_trajectories(inputs):
+    '''
+    Purpose: Returns every visit of every subject in age order with its change since the previous visit
+
+    - inputs: frame from trajectory_inputs (or several concatenated)
+    - visit_number: 1 for each subject's youngest visit, then 2, 3, ...
+    - months_since_previous: chronological months since the subject's previous visit
+    - gsv_ac_delta / gsv_ec_delta: GSV change since the previous visit
+    - gsv_ac_rate / gsv_ec_rate: GSV change per month of chronological age
+    - ac_ae_gap / ec_ae_gap / total_ae_gap: age equivalent minus chronological age, in months
+    - Missing scores (-999) and bounded age equivalents ('<' or '>') give empty values
+    '''
+    trajectories = inputs.reset_index().sort_values(['subject_id', 'age_months'], kind='stable', ignore_index=True)
+    by_subject = trajectories.groupby('subject_id', sort=False)
+
+    trajectories.insert(2, 'visit_number', by_subject.cumcount() + 1)
+    trajectories['months_since_previous'] = by_subject['age_months'].diff()
+    months_between = trajectories['months_since_previous'].where(trajectories['months_since_previous'] > 0)
+    for scale in ['ac', 'ec']:
+        trajectories[f'gsv_{scale}_delta'] = by_subject[f'gsv_{scale}'].diff()
+        trajectories[f'gsv_{scale}_rate'] = trajectories[f'gsv_{scale}_delta'] / months_between
+    for name in ['ac', 'ec', 'total']:
+        trajectories[f'{name}_ae_gap'] = trajectories[f'{name}_ae_months'] - trajectories['age_months']
+
+    return trajectories.set_index('subject_id')
@@ -0,0 +1,88 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Per-stage timing and row counts for pls_Scoring_Fcn, reported through logging.
+#          Turn on the per-participant diagnostics with logging.getLogger('PLS').setLevel(logging.DEBUG).
+
+import io
+import time
+import pstats
+import logging
+import cProfile
+import contextlib
+
+logger = logging.getLogger('PLS')
+
+
+class ScoringMetrics:
+    '''
+    Wall time, row counts and norms-cache hits/misses of one scoring run.
+
+    - stages: dict of stage name -> {'seconds': total wall time, 'rows': rows processed, 'calls': times run}
+      (streamed runs add up every chunk)
+    - cache_hits / cache_misses: norms workbooks read from the .npz cache / parsed from Excel
+    '''
+
+    def __init__(self):
+        self.stages = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        start = time.perf_counter()
+        yield
+        self.add(name, time.perf_counter() - start, rows)
+
+    def add(self, name, seconds, rows=None):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'rows': 0, 'calls': 0})
+        stage['seconds'] += seconds
+        stage['rows'] += rows or 0
+        stage['calls'] += 1
+        logger.debug('stage %s: %.4fs, %s rows', name, seconds, rows,
+                    extra={'stage': name, 'seconds': seconds, 'rows': rows})
+
+    def record_norms(self, norms):
+        self.cache_hits += norms.cache_hits
+        self.cache_misses += norms.cache_misses
+        logger.info('norms %s: %d cached, %d parsed from Excel', norms.version, norms.cache_hits,
+                    norms.cache_misses, extra={'cache_hits': norms.cache_hits, 'cache_misses': norms.cache_misses})
+
+    @property
+    def total_seconds(self):
+        return sum(stage['seconds'] for stage in self.stages.values())
+
+    def as_dict(self):
+        return {'stages': self.stages, 'total_seconds': self.total_seconds,
+                'cache_hits': self.cache_hits, 'cache_misses': self.cache_misses}
+
+
+@contextlib.contextmanager
+def profiling(profile):
+    '''
+    Opt-in profiler around the scoring core
+
+    - None / False: no profiling
+    - True: cProfile, the 25 most expensive calls are logged at INFO
+    - a file path: cProfile, stats are saved there (open with pstats or snakeviz)
+    - any context manager, e.g. a sampling profiler, is entered around the scoring core
+    '''
+    if not profile:
+        yield
+        return
+    if hasattr(profile, '__enter__'):
+        with profile:
+            yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if isinstance(profile, str):
+            profiler.dump_stats(profile)
+            logger.info('profile saved to %s', profile)
+        else:
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(25)
+            logger.info('profile:\n%s', report.getvalue())
@@ -0,0 +1,199 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Keeps a local copy of the PLS_ref_materials workbooks, so runs read the norms from local
+#          disk instead of the network share. Changed workbooks are fetched concurrently, and when
+#          the share is slow a run goes ahead with the local copies while the fetch finishes.
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import collections
+from concurrent.futures import Future, wait
+
+from PLS_norms import WORKBOOKS, DEFAULT_CACHE_DIR, file_sha256, load_norms
+from PLS_paths import DEFAULT_MIRROR_DIR
+
+logger = logging.getLogger('PLS')
+
+MANIFEST_FILE = 'manifest.json'
+
+# Serializes manifest updates from the fetch threads
+_manifest_lock = threading.Lock()
+
+# Fetch threads that may still be running (see wait_for_mirror)
+_fetch_threads = []
+_fetch_threads_lock = threading.Lock()
+
+
+def _read_manifest(mirror_dir):
+    # file name -> {'source', 'size', 'mtime', 'sha256'} of the source each local copy was made from
+    try:
+        with open(os.path.join(mirror_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_manifest(mirror_dir, file_name, entry):
+    with _manifest_lock:
+        manifest = _read_manifest(mirror_dir)
+        manifest[file_name] = entry
+        manifest_path = os.path.join(mirror_dir, MANIFEST_FILE)
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def _local_copy_valid(source_path, local_path, entry):
+    '''
+    Returns True if the local copy is the file described by its manifest entry, copied from source_path
+
+    - A size/mtime match is trusted; otherwise the copy is re-hashed and compared to the manifest
+    '''
+    if entry is None or entry['source'] != source_path:
+        return False
+    try:
+        stat = os.stat(local_path)
+    except OSError:
+        return False
+    if stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+        return True
+    if stat.st_size == entry['size'] and file_sha256(local_path) == entry['sha256']:
+        # Same content with a different mtime: restore the source mtime so later checks are cheap
+        os.utime(local_path, (entry['mtime'], entry['mtime']))
+        return True
+    return False
+
+
+def _fetch(source_path, local_path, block_size=1 << 20):
+    # Copies a workbook next to its local copy while hashing it, then swaps it in atomically
+    stat = os.stat(source_path)
+    sha256 = hashlib.sha256()
+    tmp_path = f'{local_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(source_path, 'rb') as source, open(tmp_path, 'wb') as local:
+            for block in iter(lambda: source.read(block_size), b''):
+                sha256.update(block)
+                local.write(block)
+        os.utime(tmp_path, (stat.st_mtime, stat.st_mtime))
+        os.replace(tmp_path, local_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {'source': source_path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256.hexdigest()}
+
+
+def _refresh(ref_dir, mirror_dir, file_name, entry, usable):
+    # Brings one local copy up to date with the share; returns True if it was fetched
+    source_path = os.path.join(ref_dir, file_name)
+    local_path = os.path.join(mirror_dir, file_name)
+    try:
+        stat = os.stat(source_path)
+        if usable and stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']:
+            return False
+        start = time.perf_counter()
+        _update_manifest(mirror_dir, file_name, _fetch(source_path, local_path))
+        logger.info("mirrored %s in %.2fs", file_name, time.perf_counter() - start)
+        return True
+    except OSError as exc:
+        if not usable:
+            raise
+        logger.warning("could not check %s on the share (%s), using the local copy", file_name, exc)
+        return False
+
+
+def _start_fetches(tasks, max_workers):
+    '''
+    Runs (function, args) tasks on up to max_workers threads and returns a Future for each task
+
+    - The threads are daemon threads, so a fetch still running on a slow share does not hold up the
+      interpreter's exit; an interrupted fetch leaves only a .tmp file, as copies and manifest are
+      swapped in atomically
+    '''
+    queue = collections.deque((Future(), function, args) for function, args in tasks)
+    futures = [future for future, _, _ in queue]
+
+    def worker():
+        while True:
+            try:
+                future, function, args = queue.popleft()
+            except IndexError:
+                return
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except BaseException as exc:
+                    future.set_exception(exc)
+
+    threads = [threading.Thread(target=worker, name=f'pls-mirror_{i}', daemon=True)
+               for i in range(min(max_workers, len(futures)))]
+    with _fetch_threads_lock:
+        _fetch_threads[:] = [thread for thread in _fetch_threads if thread.is_alive()] + threads
+    for thread in threads:
+        thread.start()
+    return futures
+
+
+def wait_for_mirror(timeout=None):
+    '''
+    Purpose: Waits for fetches left running in the background by mirror_reference_materials
+
+    - Call before forking (e.g. PLS_batch's worker processes): a fork while a fetch thread holds a
+      lock can deadlock the child
+    - Returns True if no fetch is still running
+    '''
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _fetch_threads_lock:
+        threads = list(_fetch_threads)
+    for thread in threads:
+        thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    with _fetch_threads_lock:
+        _fetch_threads[:] = [thread for thread in _fetch_threads if thread.is_alive()]
+        return not _fetch_threads
+
+
+def mirror_reference_materials(ref_dir, mirror_dir=DEFAULT_MIRROR_DIR, timeout=10.0, max_workers=6):
+    '''
+    Purpose: Brings the local copies of the reference workbooks up to date and returns their folder
+
+    - ref_dir: PLS_ref_materials folder on the share
+    - The first run copies every workbook; later runs compare each workbook's size/mtime on the share
+      with the manifest and fetch only the ones that changed, several at a time
+    - Local copies are validated against the manifest (size/mtime, then sha256) and fetched again if
+      they do not match
+    - timeout: if every workbook already has a valid local copy, wait at most this many seconds for
+      the share; past that the run uses the local copies and the fetch finishes in the background
+      (None waits for the share). Without a complete local copy the run always waits.
+    - Background fetches run on daemon threads; see wait_for_mirror to wait for them
+    - If the share cannot be reached, the local copies are used as they are
+    '''
+    os.makedirs(mirror_dir, exist_ok=True)
+    manifest = _read_manifest(mirror_dir)
+    file_names = [file_name for file_name, _, _ in WORKBOOKS.values()]
+    usable = {file_name: _local_copy_valid(os.path.join(ref_dir, file_name), os.path.join(mirror_dir, file_name),
+                                           manifest.get(file_name))
+              for file_name in file_names}
+
+    futures = _start_fetches([(_refresh, (ref_dir, mirror_dir, file_name, manifest.get(file_name), usable[file_name]))
+                              for file_name in file_names], max_workers)
+    done, pending = wait(futures, timeout=timeout if all(usable.values()) else None)
+    for future in done:
+        # Re-raise a failed fetch of a workbook that has no local copy to fall back on
+        future.result()
+    if pending:
+        logger.warning("the share is slow: using the local reference workbooks, %d still being fetched "
+                       "in the background", len(pending))
+    else:
+        # Every fetch is done, so the threads are only exiting
+        wait_for_mirror()
+    return mirror_dir
+
+
+def load_mirrored_norms(ref_dir, mirror_dir=DEFAULT_MIRROR_DIR, cache_dir=DEFAULT_CACHE_DIR, timeout=10.0):
+    '''
+    Purpose: load_norms from the local copies of the workbooks in ref_dir (see mirror_reference_materials)
+    '''
+    return load_norms(mirror_reference_materials(ref_dir, mirror_dir, timeout=timeout), cache_dir=cache_dir)
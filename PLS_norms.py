@@ -0,0 +1,443 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Loads the PLS reference (norms) workbooks once and keeps them in memory.
+#          Each workbook is compiled into a .npz cache on local disk so later runs
+#          skip the Excel parse unless the source workbook has changed.
+
+import os
+import json
+import hashlib
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+from PLS_paths import (REF_MATERIALS_DIR, AC_SCORES_FILE, EC_SCORES_FILE, TOTAL_SS_FILE, AC_AE_FILE, EC_AE_FILE,
+                       TOTAL_AE_FILE)
+
+logger = logging.getLogger('PLS')
+
+# Age-band sheet names in the A.1 and A.2 workbooks
+AGE_BAND_SHEETS = [
+    '0.0-0.2', '0.3-0.5', '0.6-0.8', '0.9-1.1', '1.0-1.5', '1.6-1.11',
+    '2.0-2.5', '2.6-2.11', '3.0-3.5', '3.6-3.11', '4.0-4.5', '4.6-4.11',
+    '5.0-5.5', '5.6-5.11', '6.0-6.5', '6.6-6.11', '7.0-7.5', '7.6-7.11',
+]
+
+# First and last age in months covered by each age-band sheet. The sheet names overlap
+# ('0.9-1.1' and '1.0-1.5'), so the bands are spelled out here: '0.9-1.1' is the
+# 0:9-0:11 band and every age from 1:0 onwards belongs to '1.0-1.5' and later sheets.
+AGE_BAND_MONTHS = {
+    '0.0-0.2': (0, 2),
+    '0.3-0.5': (3, 5),
+    '0.6-0.8': (6, 8),
+    '0.9-1.1': (9, 11),
+    '1.0-1.5': (12, 17),
+    '1.6-1.11': (18, 23),
+    '2.0-2.5': (24, 29),
+    '2.6-2.11': (30, 35),
+    '3.0-3.5': (36, 41),
+    '3.6-3.11': (42, 47),
+    '4.0-4.5': (48, 53),
+    '4.6-4.11': (54, 59),
+    '5.0-5.5': (60, 65),
+    '5.6-5.11': (66, 71),
+    '6.0-6.5': (72, 77),
+    '6.6-6.11': (78, 83),
+    '7.0-7.5': (84, 89),
+    '7.6-7.11': (90, 95),
+}
+
+# Sorted lower edges of the bands (in months) and the first age past the last band
+AGE_BAND_EDGES = np.array([AGE_BAND_MONTHS[sheet][0] for sheet in AGE_BAND_SHEETS])
+AGE_BAND_END = AGE_BAND_MONTHS[AGE_BAND_SHEETS[-1]][1] + 1
+
+# Accepted chronological age formats: #y#m, y:m and y.m (months 0-11)
+AGE_PATTERN = r'^(?P<years>\d+)\s*(?:y\s*(?P<ym_months>\d+)\s*m|[:.](?P<months>\d+))$'
+
+# Bump when the layout of the .npz files changes so old caches are rebuilt
+CACHE_FORMAT = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pls_norms')
+
+
+def file_sha256(path, block_size=1 << 20):
+    # Hash the workbook contents in blocks so large files are not read in one go
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Type codes for cells of object (mixed text/number) columns
+_KIND_STR, _KIND_INT, _KIND_FLOAT, _KIND_MISSING = 0, 1, 2, 3
+
+
+def _cell_kind(value):
+    if isinstance(value, str):
+        return _KIND_STR
+    if isinstance(value, (int, np.integer)):
+        return _KIND_INT
+    if pd.isna(value):
+        return _KIND_MISSING
+    return _KIND_FLOAT
+
+
+def _restore_object_column(values, kinds):
+    # Object columns are cached as strings plus a type code so each cell comes back exactly as read
+    restored = []
+    for value, kind in zip(values, kinds):
+        if kind == _KIND_INT:
+            restored.append(int(value))
+        elif kind == _KIND_FLOAT:
+            restored.append(float(value))
+        elif kind == _KIND_MISSING:
+            restored.append(np.nan)
+        else:
+            restored.append(value)
+    return restored
+
+
+def _frame_to_arrays(prefix, df):
+    # Store each column under "<prefix>/<column position>" with a native dtype where possible
+    arrays = {f'{prefix}/columns': np.array([str(c) for c in df.columns])}
+    for pos, column in enumerate(df.columns):
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values):
+            arrays[f'{prefix}/{pos}'] = values.to_numpy()
+        else:
+            arrays[f'{prefix}/{pos}/str'] = values.astype(str).to_numpy().astype(str)
+            arrays[f'{prefix}/{pos}/kind'] = np.array([_cell_kind(v) for v in values], dtype=np.int8)
+    return arrays
+
+
+def _arrays_to_frame(prefix, arrays, header):
+    columns = [str(c) for c in arrays[f'{prefix}/columns']]
+    data = {}
+    for pos, column in enumerate(columns):
+        if f'{prefix}/{pos}' in arrays:
+            data[pos] = arrays[f'{prefix}/{pos}']
+        else:
+            data[pos] = _restore_object_column(arrays[f'{prefix}/{pos}/str'].tolist(),
+                                               arrays[f'{prefix}/{pos}/kind'].tolist())
+    df = pd.DataFrame(data)
+    # Workbooks read with header=None keep their integer column labels
+    if header is None:
+        df.columns = [int(c) for c in columns]
+    else:
+        df.columns = columns
+    return df
+
+
+def _read_workbook(path, sheets, header):
+    if sheets is None:
+        return {'': pd.read_excel(path, header=header)}
+    return pd.read_excel(path, sheet_name=sheets, header=header)
+
+
+# name: (file name, sheet names or None for the first sheet, header row)
+WORKBOOKS = {
+    'ac_scores': (AC_SCORES_FILE, AGE_BAND_SHEETS, None),
+    'ec_scores': (EC_SCORES_FILE, AGE_BAND_SHEETS, None),
+    'total_ss': (TOTAL_SS_FILE, None, None),
+    'ac_ae': (AC_AE_FILE, None, 0),
+    'ec_ae': (EC_AE_FILE, None, 0),
+    'total_ae': (TOTAL_AE_FILE, None, 0),
+}
+
+
+def find_age_bands(age_months):
+    '''
+    Purpose: Returns the age-band sheet name for an array of ages in total months
+
+    - Looks every age up in AGE_BAND_EDGES with a single np.searchsorted
+    - Missing ages and ages outside 0:0 - 7:11 return None
+    '''
+    age_months = np.asarray(age_months, dtype=float)
+    band_idx = np.searchsorted(AGE_BAND_EDGES, age_months, side='right') - 1
+    in_range = ~np.isnan(age_months) & (age_months >= AGE_BAND_EDGES[0]) & (age_months < AGE_BAND_END)
+    sheets = np.array(AGE_BAND_SHEETS, dtype=object)
+    return np.where(in_range, sheets[np.clip(band_idx, 0, len(sheets) - 1)], None)
+
+
+def compile_score_table(ref_table):
+    '''
+    Purpose: Compiles one A.1/A.2 age-band sheet into dense arrays indexed by raw score
+
+    - ss / pr: standard score and percentile rank for each integer raw score 0..max
+      (NaN where the raw score is not in the sheet, i.e. scored as -999)
+    - floor_raw: raw scores below this value (second row of the first column) take
+      floor_ss / floor_pr from the first row of the sheet
+    - last_raw / last_ss / last_pr: the final row of the sheet, which wins over the floor
+      rule (and over 999) when it matches the raw score, exactly as the row-by-row scan did
+    '''
+    raw = pd.to_numeric(ref_table.iloc[:, 0], errors='coerce').to_numpy(dtype=float)
+    ss = pd.to_numeric(ref_table.iloc[:, 1], errors='coerce').to_numpy(dtype=float)
+    pr = pd.to_numeric(ref_table.iloc[:, 2], errors='coerce').to_numpy(dtype=float)
+
+    # Only whole, non-negative raw scores can be matched by index
+    usable = ~np.isnan(raw) & (raw >= 0) & (raw == np.floor(raw))
+    size = int(raw[usable].max()) + 1 if usable.any() else 0
+    dense_ss = np.full(size, np.nan)
+    dense_pr = np.full(size, np.nan)
+    # Later rows overwrite earlier ones, matching the last-match-wins scan
+    dense_ss[raw[usable].astype(int)] = ss[usable]
+    dense_pr[raw[usable].astype(int)] = pr[usable]
+    matched = np.zeros(size, dtype=bool)
+    matched[raw[usable].astype(int)] = True
+
+    return {
+        'ss': dense_ss,
+        'pr': dense_pr,
+        'matched': matched,
+        'floor_raw': raw[1] if len(raw) > 1 else np.nan,
+        'floor_ss': ss[0],
+        'floor_pr': pr[0],
+        'last_raw': raw[-1],
+        'last_ss': ss[-1],
+        'last_pr': pr[-1],
+    }
+
+
+def compile_total_ss_table(ref_table):
+    '''
+    Purpose: Compiles A.3 (Total Standard Score) into sorted interval bounds
+
+    - The first column holds 'lower-upper' ranges or single values of AC_SS + EC_SS
+    - Returns lower / upper bounds sorted by lower bound with the matching total SS and PR
+    '''
+    lower = []
+    upper = []
+    for range_of_sum in ref_table.iloc[:, 0]:
+        if '-' in str(range_of_sum):
+            lo, hi = map(int, str(range_of_sum).split('-'))
+        else:
+            lo = hi = int(range_of_sum)
+        lower.append(lo)
+        upper.append(hi)
+
+    lower = np.array(lower, dtype=int)
+    order = np.argsort(lower, kind='stable')
+    return {
+        'lower': lower[order],
+        'upper': np.array(upper, dtype=int)[order],
+        # Scores keep the workbook's own values, pls_total_ss_2 is written out as-is
+        'ss': ref_table.iloc[:, 1].to_numpy()[order],
+        'pr': ref_table.iloc[:, 2].to_numpy()[order],
+    }
+
+
+# Age equivalents are written as '[<>]years-months', e.g. '<1-3' or '4-11'
+AE_PATTERN = r'^([<>]?)(\d+)-(\d+)'
+
+
+def compile_ae_table(ref_table):
+    '''
+    Purpose: Compiles an A.4/A.5/A.6 table into arrays indexed by raw score
+
+    - AE strings are parsed once into years (#y#m) and months (##) strings, keeping the < or > prefix
+    - gsv holds the growth scale value as the string written to REDCap
+    - Where a raw score is listed more than once, the first row is used
+    - matched marks raw scores found in the table, ae_valid marks AEs that could be parsed
+    '''
+    raw = pd.to_numeric(ref_table.iloc[:, 0], errors='coerce').to_numpy(dtype=float)
+    ae_values = ref_table.iloc[:, 1].astype(str)
+    parts = ae_values.str.extract(AE_PATTERN)
+    ae_valid = parts[1].notna().to_numpy()
+
+    prefix = parts[0].fillna('')
+    years = parts[1].fillna('0').astype(int)
+    months = parts[2].fillna('0').astype(int)
+    ae_years = (prefix + years.astype(str) + 'y' + months.astype(str) + 'm').to_numpy(dtype=object)
+    ae_months = (prefix + (years * 12 + months).astype(str)).to_numpy(dtype=object)
+    gsv = np.array([str(value) for value in ref_table.iloc[:, 2]], dtype=object)
+
+    usable = ~np.isnan(raw) & (raw >= 0) & (raw == np.floor(raw))
+    size = int(raw[usable].max()) + 1 if usable.any() else 0
+    # Assign rows in reverse so the first matching row wins
+    rows = np.flatnonzero(usable)[::-1]
+    idx = raw[rows].astype(int)
+    table = {
+        'matched': np.zeros(size, dtype=bool),
+        'ae_valid': np.zeros(size, dtype=bool),
+        'ae': np.full(size, None, dtype=object),
+        'ae_years': np.full(size, None, dtype=object),
+        'ae_months': np.full(size, None, dtype=object),
+        'gsv': np.full(size, None, dtype=object),
+    }
+    table['matched'][idx] = True
+    table['ae_valid'][idx] = ae_valid[rows]
+    table['ae'][idx] = ae_values.to_numpy(dtype=object)[rows]
+    table['ae_years'][idx] = ae_years[rows]
+    table['ae_months'][idx] = ae_months[rows]
+    table['gsv'][idx] = gsv[rows]
+    return table
+
+
+class PLSNorms:
+    '''
+    In-memory store of every PLS reference table.
+
+    - ac_scores / ec_scores: dict of age-band sheet name -> DataFrame (A.1 / A.2)
+    - total_ss: DataFrame (A.3)
+    - ac_ae / ec_ae / total_ae: DataFrames (A.4 / A.5 / A.6)
+    - sources: dict of workbook name -> (path, size, mtime, sha256) the tables were built from
+    - version: hash of all the source hashes, changes whenever any workbook changes
+    - cache_hits / cache_misses: workbooks loaded from the cache / parsed from Excel
+    '''
+
+    def __init__(self, tables, sources, cache_hits=0, cache_misses=0):
+        self.ac_scores = tables['ac_scores']
+        self.ec_scores = tables['ec_scores']
+        self.total_ss = tables['total_ss']['']
+        self.ac_ae = tables['ac_ae']['']
+        self.ec_ae = tables['ec_ae']['']
+        self.total_ae = tables['total_ae']['']
+        self.sources = sources
+        # Workbooks read from the .npz cache / parsed from Excel when the store was loaded
+        self.cache_hits = cache_hits
+        self.cache_misses = cache_misses
+        self.version = hashlib.sha256(
+            json.dumps([sources[name][3] for name in sorted(sources)] + [CACHE_FORMAT]).encode()
+        ).hexdigest()[:16]
+        self._compiled = {}
+
+    def score_table(self, scale, age_band):
+        # Compiled SS/PR arrays for 'AC' or 'EC' in one age band, built on first use
+        key = ('score', scale, age_band)
+        if key not in self._compiled:
+            sheets = self.ac_scores if scale == 'AC' else self.ec_scores
+            self._compiled[key] = compile_score_table(sheets[age_band])
+        return self._compiled[key]
+
+    def ae_table(self, name):
+        # Compiled 'ac_ae', 'ec_ae' or 'total_ae' lookup arrays, built on first use
+        key = ('ae', name)
+        if key not in self._compiled:
+            self._compiled[key] = compile_ae_table(getattr(self, name))
+        return self._compiled[key]
+
+    def is_stale(self):
+        # True if any source workbook's size or mtime changed since the store was loaded
+        for path, size, mtime, sha256 in self.sources.values():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return True
+            if stat.st_size != size or stat.st_mtime != mtime:
+                return True
+        return False
+
+    def compile_all(self):
+        # Build every compiled table up front, e.g. before forking worker processes
+        for age_band in AGE_BAND_SHEETS:
+            self.score_table('AC', age_band)
+            self.score_table('EC', age_band)
+        for name in ['ac_ae', 'ec_ae', 'total_ae']:
+            self.ae_table(name)
+        self.total_ss_table()
+        return self
+
+    def total_ss_table(self):
+        # Compiled A.3 intervals, built on first use
+        if 'total_ss' not in self._compiled:
+            self._compiled['total_ss'] = compile_total_ss_table(self.total_ss)
+        return self._compiled['total_ss']
+
+
+def _cache_path(cache_dir, source_path):
+    # One cache file per workbook, keyed by the absolute source path
+    key = hashlib.sha1(os.path.abspath(source_path).encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(source_path))[0].replace(' ', '_')
+    return os.path.join(cache_dir, f'{name}-{key}.npz')
+
+
+def _load_cached(cache_file, source_path):
+    '''
+    Returns (arrays, meta) from the cache file, or (None, None) if it is missing,
+    unreadable, or was built from a different version of the workbook.
+    '''
+    if not os.path.exists(cache_file):
+        return None, None
+    try:
+        with np.load(cache_file, allow_pickle=False) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        meta = json.loads(str(arrays.pop('__meta__')))
+    except Exception:
+        # Corrupt or truncated cache (e.g. BadZipFile, missing __meta__): treat it as a miss
+        return None, None
+    if meta.get('format') != CACHE_FORMAT or meta.get('path') != os.path.abspath(source_path):
+        return None, None
+
+    stat = os.stat(source_path)
+    if meta['size'] == stat.st_size and meta['mtime'] == stat.st_mtime:
+        return arrays, meta
+
+    # Size or mtime changed (e.g. the file was copied): only rebuild if the contents changed
+    sha256 = file_sha256(source_path)
+    if sha256 != meta['sha256']:
+        return None, None
+    meta.update(size=stat.st_size, mtime=stat.st_mtime)
+    _write_cache(cache_file, arrays, meta)
+    return arrays, meta
+
+
+def _write_cache(cache_file, arrays, meta):
+    # Write to a temp file first so a crashed run never leaves a half-written cache; the temp name is
+    # unique per process and thread so concurrent runs never write into each other's file
+    tmp_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        np.savez_compressed(tmp_file, __meta__=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_file, cache_file)
+    except OSError as exc:
+        # The cache is only a speed-up: scoring goes ahead with the tables already in memory
+        logger.warning("could not write the norms cache %s (%s)", cache_file, exc)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def load_norms(ref_dir, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Purpose: Returns a PLSNorms store holding every reference table
+
+    - ref_dir: folder containing the A.1 - A.6 workbooks
+    - cache_dir: folder for the compiled .npz caches (None disables the cache)
+    - For each workbook, reuses the cache if the source path, size/mtime or sha256 still match
+    - Otherwise parses the workbook with pandas and rewrites its cache
+    '''
+    tables = {}
+    sources = {}
+    cache_hits = 0
+    for name, (file_name, sheets, header) in WORKBOOKS.items():
+        source_path = os.path.join(ref_dir, file_name)
+        arrays, meta = None, None
+        if cache_dir is not None:
+            cache_file = _cache_path(cache_dir, source_path)
+            arrays, meta = _load_cached(cache_file, source_path)
+
+        if arrays is None:
+            stat = os.stat(source_path)
+            frames = _read_workbook(source_path, sheets, header)
+            meta = {
+                'format': CACHE_FORMAT,
+                'path': os.path.abspath(source_path),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'sha256': file_sha256(source_path),
+            }
+            if cache_dir is not None:
+                arrays = {}
+                for sheet, df in frames.items():
+                    arrays.update(_frame_to_arrays(sheet, df))
+                _write_cache(cache_file, arrays, meta)
+        else:
+            cache_hits += 1
+            sheet_names = sheets if sheets is not None else ['']
+            frames = {sheet: _arrays_to_frame(sheet, arrays, header) for sheet in sheet_names}
+
+        tables[name] = frames
+        sources[name] = (meta['path'], meta['size'], meta['mtime'], meta['sha256'])
+
+    return PLSNorms(tables, sources, cache_hits=cache_hits, cache_misses=len(WORKBOOKS) - cache_hits)
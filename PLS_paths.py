@@ -0,0 +1,20 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Where the PLS reference materials live and what they are called. Kept free of NumPy and
+#          pandas so the command line (PLS_cli) can check a job without loading them.
+
+import os
+
+# Location of the reference materials, relative to root_filepath
+REF_MATERIALS_DIR = 'Assessment_Packages/PLS_package/PLS_ref_materials/'
+
+# Reference workbooks
+AC_SCORES_FILE = 'A.1 AC Scores.xlsx'
+EC_SCORES_FILE = 'A.2 EC Scores.xlsx'
+TOTAL_SS_FILE = 'A.3 Total Standard Score.xlsx'
+AC_AE_FILE = 'A.4 AC gsv + ae.xlsx'
+EC_AE_FILE = 'A.5 EC gsv + ae.xlsx'
+TOTAL_AE_FILE = 'A.6 Total ae.xlsx'
+REF_WORKBOOKS = [AC_SCORES_FILE, EC_SCORES_FILE, TOTAL_SS_FILE, AC_AE_FILE, EC_AE_FILE, TOTAL_AE_FILE]
+
+# Default local copy of the reference materials (see PLS_mirror)
+DEFAULT_MIRROR_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'pls_ref_mirror')
@@ -0,0 +1,176 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Pulls the PLS raw scores straight from the REDCap API, scores them and pushes the
+#          scores back, instead of exporting and importing CSV files by hand.
+#          Needs the requests library (pip install requests).
+
+import json
+import time
+import logging
+import datetime
+
+import pandas as pd
+
+from BRIDGE_PLS import raw_scores_from_records, prepare_raw_scores, score_raw_scores
+from PLS_norms import load_norms, REF_MATERIALS_DIR
+from PLS_validation import validate_raw_scores, summarize, ValidationError
+
+logger = logging.getLogger('PLS')
+
+
+class REDCapError(Exception):
+    pass
+
+
+class REDCapClient:
+    '''
+    Minimal REDCap API client over one pooled HTTP session.
+
+    - Every request is retried (with exponential backoff) on connection errors and 5xx responses
+    - export_records pages through the records so no single request pulls the whole project
+    - import_records sends the records in batches
+    '''
+
+    def __init__(self, api_url, api_token, page_size=500, retries=3, backoff=1.0, timeout=60, pool_size=4):
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            raise ImportError("The REDCap API mode needs the requests library: pip install requests") from None
+
+        self.api_url = api_url
+        self.api_token = api_token
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._request_errors = (requests.ConnectionError, requests.Timeout)
+
+        # Keep-alive connections are reused across every page and batch
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _post(self, data):
+        payload = {'token': self.api_token, 'format': 'json', 'returnFormat': 'json'}
+        payload.update(data)
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.api_url, data=payload, timeout=self.timeout)
+                if response.status_code < 500:
+                    break
+                error = REDCapError(f"REDCap API returned {response.status_code}: {response.text[:200]}")
+            except self._request_errors as exc:
+                error = exc
+            if attempt == self.retries:
+                raise error
+            logger.warning("REDCap API request failed (%s), retrying", error)
+            time.sleep(self.backoff * 2 ** attempt)
+
+        if response.status_code != 200:
+            raise REDCapError(f"REDCap API returned {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def export_records(self, fields, record_id_field, event_field=None):
+        '''
+        Returns a DataFrame of the given fields for every record, pulled page_size records at a time
+
+        - event_field: event column of a longitudinal project (e.g. redcap_event_name); REDCap adds it to
+          every exported row itself and rejects it as a field, so it is not requested in fields[]
+        '''
+        # First pull only the record IDs, then the requested fields one page of records at a time
+        ids = self._post({'content': 'record', 'action': 'export', 'type': 'flat', 'rawOrLabel': 'raw',
+                          'fields[0]': record_id_field})
+        record_ids = list(dict.fromkeys(row[record_id_field] for row in ids))
+
+        requested = [field for field in fields if field != event_field]
+        pages = []
+        for start in range(0, len(record_ids), self.page_size):
+            page_ids = record_ids[start:start + self.page_size]
+            data = {'content': 'record', 'action': 'export', 'type': 'flat', 'rawOrLabel': 'raw'}
+            data.update({f'fields[{i}]': field for i, field in enumerate(requested)})
+            data.update({f'records[{i}]': record_id for i, record_id in enumerate(page_ids)})
+            pages.append(pd.DataFrame(self._post(data)))
+            logger.info("pulled %d of %d records", min(start + self.page_size, len(record_ids)), len(record_ids))
+
+        if not pages:
+            return pd.DataFrame(columns=list(fields))
+        return pd.concat(pages, ignore_index=True)
+
+    def import_records(self, records, batch_size=500):
+        '''
+        Imports a list of record dicts in batches and returns the number of records REDCap accepted
+        '''
+        count = 0
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            result = self._post({'content': 'record', 'action': 'import', 'type': 'flat',
+                                 'overwriteBehavior': 'normal', 'returnContent': 'count',
+                                 'data': json.dumps(batch)})
+            count += int(result.get('count', 0))
+            logger.info("pushed %d of %d records", min(start + batch_size, len(records)), len(records))
+        return count
+
+
+def pls_REDCap_Scoring_Fcn(root_filepath, api_url, api_token,
+                           id_column, event_name_column, age_column, ac_column, ec_column,
+                           norms=None, page_size=500, import_batch_size=500, retries=3,
+                           push=True, output_file_location=None, on_invalid=None):
+    '''
+    Purpose: Pulls the five PLS fields from REDCap, scores them and pushes the scores back
+
+    - Only id, event, age, AC raw and EC raw are exported, page_size records per request
+    - push: if False, scores without importing anything (e.g. to check the results first)
+    - output_file_location: if given, also saves Importable_PLS_<date>.csv there as a record of the run
+    - on_invalid: validate the pulled records before scoring (see PLS_validation), saving the problems to
+      Importable_PLS_<date>_errors.csv in output_file_location if given; 'raise' stops with a
+      ValidationError before anything is scored or pushed, 'skip' scores only the records without
+      problems (default None: no validation pass)
+    - Returns the scored DataFrame, indexed by the record IDs as pulled from REDCap
+    '''
+    if on_invalid not in (None, 'raise', 'skip'):
+        raise ValueError(f"on_invalid must be None, 'raise' or 'skip', not {on_invalid!r}")
+    if norms is None:
+        norms = load_norms(root_filepath + REF_MATERIALS_DIR)
+    output_file_name = f'Importable_PLS_{datetime.datetime.now().date()}'
+    columns = (id_column, event_name_column, age_column, ac_column, ec_column)
+
+    with REDCapClient(api_url, api_token, page_size=page_size, retries=retries) as client:
+        records = client.export_records(list(columns), id_column, event_field=event_name_column)
+        raw_scores_df = raw_scores_from_records(records, columns)
+        if on_invalid is not None:
+            report = validate_raw_scores(raw_scores_df, columns, norms)
+            if len(report):
+                message = f"{report['row'].nunique()} invalid REDCap records ({summarize(report)})"
+                if output_file_location is not None:
+                    report_path = f'{root_filepath}{output_file_location}/{output_file_name}_errors.csv'
+                    report.to_csv(report_path, index=False)
+                    message += f", see {report_path}"
+                if on_invalid == 'raise':
+                    raise ValidationError(message, report)
+                logger.warning("skipping %s", message)
+                raw_scores_df = raw_scores_df[~raw_scores_df.index.isin(report['row'])]
+        raw_scores_df = prepare_raw_scores(raw_scores_df, columns)
+        df_final = score_raw_scores(raw_scores_df, norms, id_column, event_name_column)
+        # Push to the record IDs as pulled: the scored index cuts IDs such as BR-1 at their first '-'
+        df_final.index = pd.Index(raw_scores_df['id'].to_numpy(), name='subject_id')
+
+        if output_file_location is not None:
+            df_final.to_csv(f'{root_filepath}{output_file_location}/{output_file_name}.csv')
+
+        if push:
+            import_records = df_final.reset_index().rename(columns={'subject_id': id_column}).astype(str)
+            count = client.import_records(import_records.to_dict(orient='records'), batch_size=import_batch_size)
+            print(f"Imported {count} scored PLS records into REDCap")
+
+    print("PLS Auto-Scoring Complete!")
+    return df_final
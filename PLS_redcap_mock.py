@@ -0,0 +1,160 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: A small local stand-in for the REDCap API, for trying out PLS_redcap without a real
+#          project. It understands record export (fields / records filters) and record import.
+#
+# Usage: python PLS_redcap_mock.py <REDCap export .csv> [--port 8765] [--token TEST]
+
+import sys
+import json
+import argparse
+import threading
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+
+class MockREDCapServer:
+    '''
+    In-memory REDCap project served over HTTP on localhost.
+
+    - records: list of flat record dicts (one per subject/event), all values as text
+    - fields: the project's fields (default: the record keys; the event column is not a field);
+      exporting any other field is rejected as REDCap does
+    - fail_next: number of upcoming requests to answer with HTTP 503, to exercise retries
+    - requests: count of API requests handled
+    '''
+
+    def __init__(self, records, token='TEST', record_id_field='subject_id',
+                 event_field='redcap_event_name', port=0, fields=None):
+        self.records = [{key: '' if pd.isna(value) else str(value) for key, value in record.items()}
+                        for record in records]
+        self.token = token
+        self.record_id_field = record_id_field
+        self.event_field = event_field
+        if fields is None:
+            fields = {key for record in self.records for key in record}
+        self.fields = set(fields) - {event_field}
+        self.fail_next = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._thread = None
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        return cls(pd.read_csv(path, dtype=str).to_dict(orient='records'), **kwargs)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._httpd.server_address[1]}/api/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def unknown_fields(self, fields):
+        with self._lock:
+            return [field for field in fields if field not in self.fields]
+
+    def export_records(self, fields, record_ids):
+        selected = [record for record in self.records
+                    if not record_ids or record[self.record_id_field] in record_ids]
+        if not fields:
+            return selected
+        # REDCap always includes the record ID and the event in a longitudinal export
+        fields = list(dict.fromkeys([self.record_id_field, self.event_field] + fields))
+        return [{field: record.get(field, '') for field in fields} for record in selected]
+
+    def import_records(self, records):
+        with self._lock:
+            index = {(record[self.record_id_field], record.get(self.event_field, '')): record
+                     for record in self.records}
+            for record in records:
+                key = (record[self.record_id_field], record.get(self.event_field, ''))
+                if key in index:
+                    index[key].update({k: v for k, v in record.items() if v != ''})
+                else:
+                    self.records.append(dict(record))
+                    index[key] = self.records[-1]
+            # Imported fields (e.g. the scores) become part of the project
+            self.fields.update(key for record in records for key in record if key != self.event_field)
+        return len(records)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = parse_qs(self.rfile.read(length).decode(), keep_blank_values=True)
+                with server._lock:
+                    server.requests += 1
+                    fail = server.fail_next > 0
+                    server.fail_next = max(0, server.fail_next - 1)
+                if fail:
+                    return self._reply(503, {'error': 'Service temporarily unavailable'})
+                if form.get('token', [''])[0] != server.token:
+                    return self._reply(403, {'error': 'You do not have permissions to use the API'})
+                if form.get('content', [''])[0] != 'record':
+                    return self._reply(400, {'error': 'Only content=record is supported by the mock'})
+
+                def listed(name):
+                    keys = [key for key in form if key.startswith(f'{name}[')]
+                    return [form[key][0] for key in sorted(keys, key=lambda key: int(key[len(name) + 1:-1]))]
+
+                if form.get('action', ['export'])[0] == 'import':
+                    count = server.import_records(json.loads(form['data'][0]))
+                    return self._reply(200, {'count': count})
+                fields = listed('fields')
+                unknown = server.unknown_fields(fields)
+                if unknown:
+                    return self._reply(400, {'error': 'The following values in the parameter "fields" are not '
+                                                      f'valid: {", ".join(unknown)}'})
+                return self._reply(200, server.export_records(fields, set(listed('records'))))
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a REDCap export through a mock REDCap API')
+    parser.add_argument('export', help='REDCap raw data export (.csv) to serve')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--token', default='TEST')
+    args = parser.parse_args(argv)
+
+    server = MockREDCapServer.from_csv(args.export, token=args.token, port=args.port)
+    print(f"Mock REDCap API at {server.url} (token {args.token}), Ctrl+C to stop")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: A long-running local scoring service. The norms are loaded once and kept warm, so
+#          scoring a few new visits takes milliseconds instead of a full script start-up.
+#
+# Usage: python PLS_service.py <root_filepath> [--port 8766]
+#
+#   POST /score   {"records": [{"subject_id": ..., "redcap_event_name": ..., "chron_age_pls": ...,
+#                               "pls_aud_comp_raw": ..., "pls_exp_comm_raw": ...}, ...]}
+#                 (or a single record) -> {"records": [scored records], "norms_version": ...}
+#                 Invalid records (including ones without an age) -> 400 {"error": ..., "problems": [one entry
+#                 per problem, see PLS_validation]}
+#   GET  /health  -> {"status": "ok", "norms_version": ..., "loaded_at": ...}
+
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from BRIDGE_PLS import raw_scores_from_records, prepare_raw_scores, score_raw_scores
+from PLS_norms import load_norms, REF_MATERIALS_DIR, DEFAULT_CACHE_DIR
+from PLS_validation import validate_raw_scores, summarize, ValidationError, REPORT_COLUMNS
+
+logger = logging.getLogger('PLS')
+
+DEFAULT_COLUMNS = ('subject_id', 'redcap_event_name', 'chron_age_pls', 'pls_aud_comp_raw', 'pls_exp_comm_raw')
+
+
+class NormsWatcher:
+    '''
+    Holds the current norms store and reloads it when a reference workbook changes.
+
+    - current() returns the store to score with; at most every check_interval seconds it checks
+      the workbooks' size/mtime and, if they changed, loads and compiles a new store
+    - Requests in flight keep the store they started with, so a reload never disturbs them
+    - If a reload fails, the loaded store keeps being served and the reload is retried at the next check
+    '''
+
+    def __init__(self, ref_dir, cache_dir=DEFAULT_CACHE_DIR, check_interval=5.0):
+        self.ref_dir = ref_dir
+        self.cache_dir = cache_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        # Compile every lookup table up front so request threads only ever read the store
+        self.norms = load_norms(self.ref_dir, cache_dir=self.cache_dir).compile_all()
+        self.loaded_at = datetime.datetime.now().isoformat(timespec='seconds')
+        self._checked_at = time.monotonic()
+        logger.info("norms %s loaded", self.norms.version)
+
+    def current(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    try:
+                        if self.norms.is_stale():
+                            self._load()
+                    except Exception:
+                        # e.g. a workbook being saved or missing: keep serving the loaded norms
+                        logger.exception("could not reload the norms, keeping %s until the next check",
+                                         self.norms.version)
+                    self._checked_at = time.monotonic()
+        return self.norms
+
+
+def score_records(records, norms, columns=DEFAULT_COLUMNS):
+    '''
+    Purpose: Scores a list of REDCap-style records and returns the scored records as dicts
+
+    - The records are validated first (see PLS_validation); if any has a problem nothing is scored and
+      a ValidationError carrying the row-level report is raised (row = position in records)
+    - Records that are not objects, or have no age (e.g. a misspelled age field), are problems too, since
+      the scorer would silently leave them out
+    '''
+    id_column, event_name_column, age_column = columns[:3]
+    if not isinstance(records, list):
+        raise ValueError('records must be a list of records')
+    not_records = [row for row, record in enumerate(records) if not isinstance(record, dict)]
+    if not_records:
+        report = pd.DataFrame({'row': not_records, 'subject_id': None, 'redcap_event_name': None, 'column': None,
+                               'value': [records[row] for row in not_records],
+                               'problem': 'not a record (expected a JSON object)'}, columns=REPORT_COLUMNS)
+        raise ValidationError(f"{len(not_records)} invalid records ({summarize(report)})", report)
+
+    raw_scores_df = raw_scores_from_records(records, columns)
+    no_age = raw_scores_df[age_column].isna()
+    report = pd.concat([pd.DataFrame({
+        'row': raw_scores_df.index[no_age], 'subject_id': raw_scores_df.loc[no_age, id_column].astype(object),
+        'redcap_event_name': raw_scores_df.loc[no_age, event_name_column].astype(object),
+        'column': age_column, 'value': None, 'problem': 'missing age, the record cannot be scored',
+    }, columns=REPORT_COLUMNS), validate_raw_scores(raw_scores_df, columns, norms)], ignore_index=True)
+    report = report.sort_values('row', kind='stable', ignore_index=True)
+    if len(report):
+        raise ValidationError(f"{report['row'].nunique()} invalid records ({summarize(report)})", report)
+    raw_scores_df = prepare_raw_scores(raw_scores_df, columns)
+    df_final = score_raw_scores(raw_scores_df, norms, id_column, event_name_column)
+    df_final = df_final.reset_index().rename(columns={'subject_id': id_column})
+    return json.loads(df_final.to_json(orient='records'))
+
+
+def make_server(root_filepath, host='127.0.0.1', port=8766, columns=DEFAULT_COLUMNS, check_interval=5.0,
+                cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Purpose: Returns a ready-to-run scoring server (call serve_forever() on it)
+
+    - Each request is handled on its own thread against the shared, preloaded norms
+    '''
+    watcher = NormsWatcher(root_filepath + REF_MATERIALS_DIR, cache_dir=cache_dir, check_interval=check_interval)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            logger.debug(format, *args)
+
+        def _reply(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self._reply(404, {'error': f'Unknown path {self.path}'})
+            norms = watcher.current()
+            self._reply(200, {'status': 'ok', 'norms_version': norms.version, 'loaded_at': watcher.loaded_at})
+
+        def do_POST(self):
+            if self.path != '/score':
+                return self._reply(404, {'error': f'Unknown path {self.path}'})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            except ValueError:
+                return self._reply(400, {'error': 'Request body is not valid JSON'})
+            records = body.get('records', [body]) if isinstance(body, dict) else body
+
+            norms = watcher.current()
+            start = time.perf_counter()
+            try:
+                scored = score_records(records, norms, columns)
+            except ValidationError as exc:
+                problems = json.loads(exc.report.to_json(orient='records'))
+                return self._reply(400, {'error': str(exc), 'problems': problems})
+            except (ValueError, KeyError) as exc:
+                return self._reply(400, {'error': str(exc)})
+            logger.info("scored %d records in %.1f ms", len(scored), (time.perf_counter() - start) * 1000)
+            self._reply(200, {'records': scored, 'norms_version': norms.version})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.watcher = watcher
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the warm PLS scoring service')
+    parser.add_argument('root_filepath', help='folder containing Assessment_Packages/PLS_package/PLS_ref_materials')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--check-interval', type=float, default=5.0,
+                        help='seconds between checks of the reference workbooks for changes')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    server = make_server(args.root_filepath, host=args.host, port=args.port, check_interval=args.check_interval)
+    print(f"PLS scoring service on http://{args.host}:{server.server_address[1]}/score, Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Checks a whole REDCap export in one vectorized pass before any scoring starts, so a
+#          broken file is reported row by row up front instead of failing partway through a run.
+
+import numpy as np
+import pandas as pd
+
+from PLS_norms import find_age_bands, AGE_PATTERN, AGE_BAND_EDGES, AGE_BAND_END
+
+REPORT_COLUMNS = ['row', 'subject_id', 'redcap_event_name', 'column', 'value', 'problem']
+DUPLICATE_VISIT = 'duplicate subject/event pair'
+
+
+class ValidationError(ValueError):
+    # Raised for on_invalid='raise'; report holds every problem found (see validate_raw_scores)
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def _in_norms(raw_values, score_table):
+    # True where lookup_ss_pr finds a score for the raw score (rather than falling back to -999)
+    size = len(score_table['matched'])
+    idx = np.where((raw_values >= 0) & (raw_values < size), raw_values, 0).astype(int)
+    matched = (raw_values >= 0) & (raw_values < size) & score_table['matched'][idx] if size else False
+    return (matched | (raw_values < score_table['floor_raw']) | (raw_values == 999)
+            | (raw_values == score_table['last_raw']))
+
+
+def validate_raw_scores(raw_scores_df, columns, norms):
+    '''
+    Purpose: Returns a report of every problem in a raw scores frame, one row per problem
+
+    - columns: (id, event name, age, AC raw, EC raw) column names, as read by read_raw_scores
+    - Checks: missing subject IDs, age formats and ranges, missing (non -999) or fractional raw scores,
+      raw scores outside their age band's A.1 / A.2 norm table, and duplicate subject/event pairs
+    - Rows without an age are not checked, as they are never scored
+    - The report has the columns REPORT_COLUMNS; row is the row's index in raw_scores_df
+      (0 = first row after the header of the export)
+    '''
+    id_column, event_name_column, age_column, ac_column, ec_column = columns
+    index = raw_scores_df.index
+    has_age = raw_scores_df[age_column].notna().to_numpy()
+    problems = []
+
+    def flag(mask, column, problem):
+        # problem is one message for every flagged row, or an array with a message per row
+        if mask.any():
+            problems.append(pd.DataFrame({
+                'row': index[mask],
+                'subject_id': raw_scores_df[id_column].to_numpy()[mask],
+                'redcap_event_name': raw_scores_df[event_name_column].astype(object).to_numpy()[mask],
+                'column': column,
+                'value': raw_scores_df[column].astype(object).to_numpy()[mask],
+                'problem': problem[mask] if isinstance(problem, np.ndarray) else problem,
+            }))
+
+    flag(has_age & raw_scores_df[id_column].isna().to_numpy(), id_column, 'missing subject ID')
+
+    # Ages: format, months 0-11 and within the age bands of the norms
+    parts = raw_scores_df[age_column].astype(str).str.strip().str.extract(AGE_PATTERN)
+    bad_format = has_age & parts['years'].isna().to_numpy()
+    years = pd.to_numeric(parts['years']).to_numpy(dtype=float)
+    months = pd.to_numeric(parts['ym_months'].fillna(parts['months'])).to_numpy(dtype=float)
+    bad_months = has_age & ~bad_format & (months >= 12)
+    age_bands = find_age_bands(np.where(bad_months, np.nan, years * 12 + months))
+    out_of_range = has_age & ~bad_format & ~bad_months & pd.isna(age_bands)
+    flag(bad_format, age_column, 'unsupported age format (use #y#m, y:m or y.m)')
+    flag(bad_months, age_column, 'months must be 0-11')
+    first, last = AGE_BAND_EDGES[0], AGE_BAND_END - 1
+    flag(out_of_range, age_column,
+         f'age outside the PLS norms ({first // 12}:{first % 12} to {last // 12}:{last % 12})')
+
+    # Raw scores: present (-999 for missing data), whole numbers and found in the age band's table
+    for raw_column, scale in [(ac_column, 'AC'), (ec_column, 'EC')]:
+        raw_values = pd.to_numeric(raw_scores_df[raw_column]).to_numpy(dtype=float, na_value=np.nan)
+        missing = has_age & np.isnan(raw_values)
+        fractional = has_age & ~missing & (raw_values != np.floor(raw_values))
+        flag(missing, raw_column, 'missing raw score (use -999 for missing data)')
+        flag(fractional, raw_column, 'raw score is not a whole number')
+
+        to_check = ~pd.isna(age_bands) & has_age & ~missing & ~fractional & (raw_values != -999)
+        outside = np.zeros(len(raw_values), dtype=bool)
+        for age_band in pd.unique(age_bands[to_check]):
+            in_band = to_check & (age_bands == age_band)
+            outside[in_band] = ~_in_norms(raw_values[in_band], norms.score_table(scale, age_band))
+        flag(outside, raw_column, (f'raw score not in the {scale} norms for age band '
+                                   + pd.Series(age_bands, dtype=object).astype(str)).to_numpy())
+
+    # Each subject should appear once per event
+    keys = raw_scores_df[[id_column, event_name_column]].astype(object)
+    duplicated = has_age & keys.duplicated(keep=False).to_numpy() & keys[id_column].notna().to_numpy()
+    flag(duplicated, event_name_column, DUPLICATE_VISIT)
+
+    if not problems:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(problems, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+
+
+def validate_export(raw_score_chunks, columns, norms):
+    '''
+    Purpose: Validates an export read in chunks (read_raw_scores with chunksize) and returns one report
+
+    - Only the key columns of each chunk are kept, so duplicate subject/event pairs are found
+      across the whole export without holding it in memory
+    '''
+    reports = []
+    keys = []
+    id_column, event_name_column = columns[0], columns[1]
+    for chunk in raw_score_chunks:
+        report = validate_raw_scores(chunk, columns, norms)
+        reports.append(report[report['problem'] != DUPLICATE_VISIT])
+        has_key = chunk[columns[2]].notna() & chunk[id_column].notna()
+        keys.append(chunk.loc[has_key, [id_column, event_name_column]].astype(object))
+
+    if keys:
+        keys = pd.concat(keys)
+        duplicated = keys[keys.duplicated(keep=False)]
+        reports.append(pd.DataFrame({
+            'row': duplicated.index, 'subject_id': duplicated[id_column].to_numpy(),
+            'redcap_event_name': duplicated[event_name_column].to_numpy(), 'column': event_name_column,
+            'value': duplicated[event_name_column].to_numpy(), 'problem': DUPLICATE_VISIT,
+        }))
+
+    reports = [report for report in reports if len(report)]
+    if not reports:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(reports, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+
+
+def summarize(report):
+    # One line per kind of problem, e.g. "3 x missing subject ID"
+    counts = report['problem'].value_counts()
+    return '; '.join(f'{count} x {problem}' for problem, count in counts.items())
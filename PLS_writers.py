@@ -0,0 +1,141 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Output writers for the scored PLS frame. The output format no longer has to follow
+#          the input format: CSV (REDCap import), constant-memory XLSX, or Parquet for analytics.
+#          Every writer can be written to more than once, so streamed runs append chunk by chunk.
+
+import os
+
+import pandas as pd
+
+# Columns that hold text in the REDCap import (age equivalents can carry a < or > prefix and
+# GSVs are written as strings); every other scored column is a whole number
+TEXT_COLUMNS = [
+    'subject_id', 'redcap_event_name', 'pls_aud_comp_ae_ym', 'pls_aud_comp_ae_m', 'pls_exp_comm_ae_ym',
+    'pls_exp_comm_ae_m', 'pls_total_ae_ym', 'pls_total_ae_m', 'pls_gsv_ac', 'pls_gsv_ec',
+]
+
+
+class CSVWriter:
+    # pandas' C writer; appends every later frame without repeating the header
+    extension = '.csv'
+
+    def __init__(self, path):
+        self.path = path
+        self._started = False
+
+    def write(self, df):
+        if not self._started:
+            df.to_csv(self.path)
+            self._started = True
+        else:
+            df.to_csv(self.path, mode='a', header=False)
+
+    def close(self):
+        pass
+
+
+class XLSXWriter:
+    # openpyxl write-only mode streams rows to disk instead of keeping every cell in memory
+    extension = '.xlsx'
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet('Sheet1')
+        self._started = False
+
+    def write(self, df):
+        if not self._started:
+            self._sheet.append([df.index.name] + [str(column) for column in df.columns])
+            self._started = True
+        for index, row in zip(df.index, df.itertuples(index=False, name=None)):
+            self._sheet.append([index] + [None if pd.isna(value) else value for value in row])
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+class ParquetWriter:
+    # Columnar output through pyarrow, with one fixed schema so every chunk lands in the same file
+    extension = '.parquet'
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs the pyarrow library: pip install pyarrow") from None
+
+        self.path = path
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._writer = None
+        self._schema = None
+
+    def _schema_for(self, df):
+        # Fixed by column name and dtype, never inferred from the values: an empty first chunk would
+        # otherwise give every text column the null type and the next chunk would not fit
+        pa = self._pa
+        fields = []
+        for column in [df.index.name] + list(df.columns):
+            if column in TEXT_COLUMNS:
+                fields.append((column, pa.string()))
+            elif column in df.columns and pd.api.types.is_float_dtype(df[column]):
+                fields.append((column, pa.float64()))
+            else:
+                fields.append((column, pa.int64()))
+        return pa.schema(fields)
+
+    def _to_table(self, df):
+        df = df.reset_index()
+        for column in df.columns:
+            if column in TEXT_COLUMNS:
+                # -999 stays the text '-999', as in the CSV import file
+                df[column] = df[column].astype(str).where(df[column].notna(), None)
+            elif pd.api.types.is_float_dtype(df[column]):
+                # Measures such as rates stay floating point
+                df[column] = df[column].astype('float64')
+            else:
+                df[column] = pd.to_numeric(df[column]).astype('Int64')
+        return self._pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+    def write(self, df):
+        if self._schema is None:
+            self._schema = self._schema_for(df)
+        # The file is opened with the first rows, so runs whose first chunks are empty still work
+        if len(df) == 0:
+            return
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(self._to_table(df))
+
+    def close(self):
+        if self._writer is None and self._schema is not None:
+            # Nothing but empty frames: still leave a file with the columns
+            self._writer = self._pq.ParquetWriter(self.path, self._schema)
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'xlsx': XLSXWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def open_writer(path_without_extension, output_format):
+    '''
+    Purpose: Returns a writer for 'csv', 'xlsx' or 'parquet' output at path_without_extension + extension
+    '''
+    if output_format not in WRITERS:
+        raise ValueError(f"Unsupported output format {output_format!r}, choose from {', '.join(WRITERS)}")
+    writer = WRITERS[output_format]
+    return writer(path_without_extension + writer.extension)
+
+
+def output_format_for(filepath):
+    # The format that matches an input file's extension (the default before output formats were pluggable)
+    return os.path.splitext(filepath)[1].lstrip('.').lower()
@@ -0,0 +1,42 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Shared fixtures: a root_filepath with the synthetic reference workbooks from PLS_benchmark,
+#          and a helper that writes small REDCap-style exports into its PLS_inputs folder.
+
+import os
+
+import pandas as pd
+import pytest
+
+from PLS_benchmark import COLUMNS, make_synthetic_norms
+from PLS_norms import load_norms, REF_MATERIALS_DIR
+
+INPUTS_DIR = 'Assessment_Packages/PLS_package/PLS_inputs/'
+
+
+@pytest.fixture(scope='session')
+def synthetic_root(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('synthetic_root')) + '/'
+    make_synthetic_norms(root + REF_MATERIALS_DIR, seed=0)
+    os.makedirs(root + INPUTS_DIR)
+    return root
+
+
+@pytest.fixture(scope='session')
+def synthetic_norms(synthetic_root):
+    return load_norms(synthetic_root + REF_MATERIALS_DIR, cache_dir=None).compile_all()
+
+
+@pytest.fixture
+def output_dir(synthetic_root, tmp_path):
+    # A fresh output folder per test, given relative to root_filepath as pls_Scoring_Fcn expects
+    return os.path.relpath(tmp_path, synthetic_root)
+
+
+def write_export(root_filepath, name, rows):
+    '''
+    Writes rows of (subject_id, redcap_event_name, chron_age_pls, AC raw, EC raw) as an export in
+    PLS_inputs and returns its path relative to root_filepath
+    '''
+    export_file = INPUTS_DIR + name
+    pd.DataFrame(rows, columns=list(COLUMNS)).to_csv(root_filepath + export_file, index=False)
+    return export_file
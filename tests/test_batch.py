@@ -0,0 +1,50 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Batch scoring of several exports across worker processes (PLS_batch)
+
+import os
+
+import pandas as pd
+import pytest
+
+from PLS_batch import pls_Batch_Scoring_Fcn, export_names
+from PLS_benchmark import COLUMNS, make_synthetic_export
+from conftest import INPUTS_DIR
+
+
+@pytest.fixture
+def sites(synthetic_root, tmp_path_factory):
+    # sites/a/export.csv (30 visits) and sites/b/export.csv (20 visits), relative to root_filepath
+    sites_dir = os.path.relpath(tmp_path_factory.mktemp('sites'), synthetic_root)
+    for site, n_rows in [('a', 30), ('b', 20)]:
+        os.makedirs(f'{synthetic_root}{sites_dir}/{site}')
+        make_synthetic_export(f'{synthetic_root}{sites_dir}/{site}/export.csv', n_rows, seed=n_rows,
+                              extra_columns=2, missing_rate=0)
+    return sites_dir
+
+
+def test_export_names(synthetic_root):
+    assert export_names(synthetic_root, 'sites/*/export.csv', ['sites/a/export.csv', 'sites/b/export.csv']) == \
+        ['a_export', 'b_export']
+    assert export_names(synthetic_root, INPUTS_DIR + 'site_*.csv', [INPUTS_DIR + 'site_1.csv']) == ['site_1']
+    assert export_names(synthetic_root, INPUTS_DIR.rstrip('/'), [INPUTS_DIR + 'x.csv']) == ['x']
+
+
+def test_exports_with_the_same_file_name(synthetic_root, synthetic_norms, sites, output_dir):
+    results = pls_Batch_Scoring_Fcn(synthetic_root, f'{sites}/*/export.csv', *COLUMNS, output_dir,
+                                    merged_output=True, max_workers=2, norms=synthetic_norms)
+    assert [len(df_final) for df_final in results.values()] == [30, 20]
+
+    outputs = sorted(os.listdir(synthetic_root + output_dir))
+    assert [name.rsplit('_', 1)[0] for name in outputs] == \
+        ['Importable_PLS_a_export', 'Importable_PLS_b_export', 'Importable_PLS_merged']
+    lengths = [len(pd.read_csv(f'{synthetic_root}{output_dir}/{name}')) for name in outputs]
+    assert lengths == [30, 20, 50]
+
+
+def test_clashing_outputs_are_refused(synthetic_root, synthetic_norms, sites, output_dir):
+    pd.read_csv(f'{synthetic_root}{sites}/a/export.csv').to_excel(f'{synthetic_root}{sites}/a/export.xlsx',
+                                                                   index=False)
+    with pytest.raises(ValueError, match='same output file'):
+        pls_Batch_Scoring_Fcn(synthetic_root, f'{sites}/a', *COLUMNS, output_dir, norms=synthetic_norms,
+                              output_format='csv')
+    assert os.listdir(synthetic_root + output_dir) == []
@@ -0,0 +1,118 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: The pls-score command line (PLS_cli): config files, --dry-run and a full run
+
+import os
+import sys
+import json
+import functools
+import subprocess
+
+import pandas as pd
+import pytest
+
+from PLS_benchmark import COLUMNS
+from PLS_cli import build_parser, resolve_settings, dry_run, main
+from PLS_norms import load_norms
+from PLS_paths import REF_MATERIALS_DIR, DEFAULT_MIRROR_DIR, AC_SCORES_FILE
+from conftest import write_export
+
+VISITS = [
+    ('S001', 'visit_1_arm_1', '3y2m', 20, 25),
+    ('S002', 'visit_1_arm_1', '2.6', 15, 18),
+]
+
+
+def settings_for(argv):
+    return resolve_settings(build_parser().parse_args(argv))
+
+
+def test_config_merging(tmp_path):
+    toml_config = tmp_path / 'pls.toml'
+    toml_config.write_text('[pls]\nroot = "/data"\ninput = "export.csv"\nchunksize = 500\nmirror = true\n')
+    settings = settings_for(['--config', str(toml_config)])
+    assert (settings['root'], settings['input'], settings['chunksize']) == ('/data/', 'export.csv', 500)
+    assert settings['mirror'] == DEFAULT_MIRROR_DIR
+    assert settings['output_dir'] == 'PLS' and settings['id_column'] == 'subject_id'
+
+    # The command line overrides the config file
+    settings = settings_for(['--config', str(toml_config), '--input', 'other.csv', '--mirror', '/mirror'])
+    assert (settings['input'], settings['chunksize'], settings['mirror']) == ('other.csv', 500, '/mirror')
+
+    json_config = tmp_path / 'pls.json'
+    json_config.write_text(json.dumps({'input': 'export.xlsx', 'format': 'parquet', 'mirror': False}))
+    settings = settings_for(['--config', str(json_config)])
+    assert (settings['format'], settings['mirror']) == ('parquet', None)
+
+
+@pytest.mark.parametrize('config, message', [
+    ({'input': 'export.csv', 'chunk_size': 10}, 'Unknown settings'),
+    ({'output_dir': 'PLS'}, 'No input export'),
+    ({'input': 'export.csv', 'format': 'json'}, 'format must be'),
+    ({'input': 'export.csv', 'ledger': 'ledger.db', 'trajectories': True}, 'cannot be combined'),
+])
+def test_invalid_config(tmp_path, config, message):
+    config_path = tmp_path / 'pls.json'
+    config_path.write_text(json.dumps(config))
+    with pytest.raises(ValueError, match=message):
+        settings_for(['--config', str(config_path)])
+    assert main(['--config', str(config_path)]) == 2
+
+
+def test_dry_run(synthetic_root, output_dir, tmp_path):
+    export_file = write_export(synthetic_root, 'cli.csv', VISITS)
+    base = ['--root', synthetic_root, '--output-dir', output_dir]
+    assert dry_run(settings_for(base + ['--input', export_file])) == []
+
+    problems = dry_run(settings_for(base + ['--input', 'missing.csv', '--ledger', str(tmp_path / 'no' / 'l.db')]))
+    assert [problem.split(':')[0] for problem in problems] == ['export not found', 'ledger folder not found']
+
+    problems = dry_run(settings_for(base + ['--input', export_file, '--age-column', 'age']))
+    assert problems == [f'columns missing from {synthetic_root}{export_file}: age']
+
+    xlsx_file = export_file.replace('.csv', '.xlsx')
+    pd.read_csv(synthetic_root + export_file).to_excel(synthetic_root + xlsx_file, index=False)
+    assert dry_run(settings_for(base + ['--input', xlsx_file, '--chunksize', '10'])) == \
+        ['chunksize needs a .csv export']
+
+    problems = dry_run(settings_for(['--root', str(tmp_path), '--input', export_file]))
+    assert [problem.split(':')[0] for problem in problems] == \
+        ['export not found', f'reference workbooks missing from {tmp_path}/{REF_MATERIALS_DIR}',
+         'output folder not found']
+
+
+def test_mirror_stands_in_for_the_share(synthetic_root, output_dir, tmp_path):
+    # Without the share, only the workbooks missing from the mirror are problems
+    root = str(tmp_path / 'root') + '/'
+    export_file = write_export(synthetic_root, 'cli.csv', VISITS)
+    os.makedirs(os.path.dirname(root + export_file))
+    os.rename(synthetic_root + export_file, root + export_file)
+    os.makedirs(root + 'PLS')
+    mirror_dir = synthetic_root + REF_MATERIALS_DIR
+    assert dry_run(settings_for(['--root', root, '--input', export_file, '--mirror', mirror_dir])) == []
+
+    mirror_dir = str(tmp_path / 'mirror')
+    os.makedirs(mirror_dir)
+    problems = dry_run(settings_for(['--root', root, '--input', export_file, '--mirror', mirror_dir]))
+    assert len(problems) == 1 and AC_SCORES_FILE in problems[0]
+
+
+def test_dry_run_does_not_import_pandas(synthetic_root, output_dir):
+    export_file = write_export(synthetic_root, 'cli.csv', VISITS)
+    code = ("import sys, PLS_cli; status = PLS_cli.main(sys.argv[1:]); "
+            "sys.exit(status or ('pandas' in sys.modules or 'numpy' in sys.modules) * 3)")
+    result = subprocess.run([sys.executable, '-c', code, '--root', synthetic_root, '--input', export_file,
+                             '--output-dir', output_dir, '--dry-run'],
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'Dry run OK' in result.stdout
+
+
+def test_scores_an_export(synthetic_root, output_dir, tmp_path, monkeypatch):
+    # Keep the compiled norms out of the user's cache folder
+    monkeypatch.setattr('BRIDGE_PLS.load_norms', functools.partial(load_norms, cache_dir=None))
+    export_file = write_export(synthetic_root, 'cli.csv', VISITS)
+    config_path = tmp_path / 'pls.json'
+    config_path.write_text(json.dumps({'root': synthetic_root, 'input': export_file, 'output_dir': output_dir}))
+    assert main(['--config', str(config_path), '--output-name', 'scored', '--format', 'xlsx']) == 0
+    scored = pd.read_excel(f'{synthetic_root}{output_dir}/scored.xlsx', dtype=str)
+    assert scored['subject_id'].tolist() == ['S001', 'S002']
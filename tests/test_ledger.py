@@ -0,0 +1,73 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Incremental scoring with the SQLite ledger (PLS_ledger)
+
+import pandas as pd
+
+from BRIDGE_PLS import pls_Scoring_Fcn, raw_scores_from_records, prepare_raw_scores
+from PLS_benchmark import COLUMNS
+from PLS_ledger import open_ledger, unscored_rows, record_scored, visit_keys
+from conftest import write_export
+
+VISITS = [
+    ('S001', 'visit_1_arm_1', '3y2m', 20, 25),
+    ('S001', 'visit_2_arm_1', '4y0m', 30, 31),
+    ('S002', 'visit_1_arm_1', '2.6', 15, 18),
+]
+
+
+def prepared(rows):
+    records = pd.DataFrame(rows, columns=list(COLUMNS)).astype(str)
+    return prepare_raw_scores(raw_scores_from_records(records, COLUMNS), COLUMNS)
+
+
+def test_unscored_rows(tmp_path):
+    ledger = open_ledger(str(tmp_path / 'ledger.db'))
+    raw_scores_df = prepared(VISITS)
+
+    # First run: everything is new
+    assert unscored_rows(ledger, raw_scores_df, 'v1').tolist() == [True, True, True]
+    record_scored(ledger, visit_keys(raw_scores_df), 'v1')
+
+    # Second run with nothing new
+    assert unscored_rows(ledger, raw_scores_df, 'v1').tolist() == [False, False, False]
+
+    # A changed raw score, then a changed age
+    changed = list(VISITS)
+    changed[1] = ('S001', 'visit_2_arm_1', '4y0m', 30, 32)
+    assert unscored_rows(ledger, prepared(changed), 'v1').tolist() == [False, True, False]
+    changed[1] = ('S001', 'visit_2_arm_1', '4y1m', 30, 31)
+    assert unscored_rows(ledger, prepared(changed), 'v1').tolist() == [False, True, False]
+
+    # New norms: everything is scored again
+    assert unscored_rows(ledger, raw_scores_df, 'v2').tolist() == [True, True, True]
+
+
+def test_ids_with_dashes_are_separate_visits(tmp_path):
+    ledger = open_ledger(str(tmp_path / 'ledger.db'))
+    first = prepared([('BR-1', 'visit_1_arm_1', '3y2m', 20, 25)])
+    record_scored(ledger, visit_keys(first), 'v1')
+
+    # Same event, age and raw scores, but a different subject
+    second = prepared([('BR-1', 'visit_1_arm_1', '3y2m', 20, 25), ('BR-2', 'visit_1_arm_1', '3y2m', 20, 25)])
+    assert visit_keys(second)['subject_id'].tolist() == ['BR-1', 'BR-2']
+    assert unscored_rows(ledger, second, 'v1').tolist() == [False, True]
+
+
+def test_incremental_runs(synthetic_root, synthetic_norms, output_dir, tmp_path):
+    ledger_path = str(tmp_path / 'ledger.db')
+
+    def run(rows, name):
+        export_file = write_export(synthetic_root, f'{name}.csv', rows)
+        pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms,
+                        output_file_name=name, ledger_path=ledger_path)
+        return pd.read_csv(f'{synthetic_root}{output_dir}/{name}.csv', dtype=str)
+
+    rows = VISITS + [('BR-1', 'visit_1_arm_1', '3y2m', 20, 25)]
+    assert len(run(rows, 'first')) == 4
+    assert len(run(rows, 'nothing_new')) == 0
+
+    rows = rows + [('BR-2', 'visit_1_arm_1', '3y2m', 20, 25)]
+    rows[0] = ('S001', 'visit_1_arm_1', '3y2m', 21, 25)
+    scored = run(rows, 'changed')
+    assert scored['pls_aud_comp_raw'].tolist() == ['21', '20']
+    assert len(run(rows, 'again')) == 0
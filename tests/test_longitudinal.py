@@ -0,0 +1,62 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Per-subject trajectories across visits (PLS_longitudinal) on the synthetic norms, where a
+#          raw score r has GSV 200 + 3r and an age equivalent of 3 + 2r months ('<' for 0, '>' for the top)
+
+import numpy as np
+import pandas as pd
+
+from BRIDGE_PLS import pls_Scoring_Fcn, raw_scores_from_records, prepare_raw_scores, score_raw_scores
+from PLS_benchmark import COLUMNS, MAX_RAW
+from PLS_longitudinal import trajectory_inputs, compute_trajectories
+from conftest import write_export
+
+VISITS = [
+    ('BR-1', 'visit_2_arm_1', '3y6m', 16, 12),
+    ('BR-1', 'visit_1_arm_1', '3y0m', 10, 12),
+    ('BR-2', 'visit_1_arm_1', '3y0m', -999, 0),
+    ('BR-3', 'visit_1_arm_1', '6y0m', MAX_RAW, 30),
+]
+
+
+def trajectories_for(rows, norms):
+    records = pd.DataFrame(rows, columns=list(COLUMNS)).astype(str)
+    raw_scores_df = prepare_raw_scores(raw_scores_from_records(records, COLUMNS), COLUMNS)
+    df_final = score_raw_scores(raw_scores_df, norms, 'subject_id', 'redcap_event_name')
+    return compute_trajectories(trajectory_inputs(df_final, raw_scores_df))
+
+
+def test_deltas_rates_and_gaps(synthetic_norms):
+    trajectories = trajectories_for(VISITS, synthetic_norms)
+
+    # Subjects whose IDs share the part before '-' stay separate, visits in age order
+    assert trajectories.index.tolist() == ['BR-1', 'BR-1', 'BR-2', 'BR-3']
+    assert trajectories['visit_number'].tolist() == [1, 2, 1, 1]
+    assert trajectories['redcap_event_name'].tolist()[:2] == ['visit_1_arm_1', 'visit_2_arm_1']
+
+    second_visit = trajectories.iloc[1]
+    assert second_visit['months_since_previous'] == 6
+    assert second_visit['gsv_ac_delta'] == 3 * (16 - 10)
+    assert second_visit['gsv_ac_rate'] == 3.0
+    assert second_visit['gsv_ec_delta'] == 0
+    assert second_visit['ac_ae_gap'] == (3 + 2 * 16) - 42
+    assert second_visit['total_ae_gap'] == (3 + 2 * 28) - 42
+
+    # First visits have no change; -999 scores and bounded ('<', '>') age equivalents stay empty
+    assert np.isnan(trajectories.iloc[0][['months_since_previous', 'gsv_ac_delta', 'gsv_ac_rate']]
+                    .to_numpy(dtype=float)).all()
+    only_visit = trajectories.iloc[2]
+    assert np.isnan(only_visit['gsv_ac']) and np.isnan(only_visit['ac_ae_gap'])
+    assert np.isnan(only_visit['ec_ae_gap']) and np.isnan(only_visit['total_ae_gap'])
+    assert only_visit['gsv_ec'] == 200
+    assert np.isnan(trajectories.iloc[3]['ac_ae_gap'])
+    assert trajectories.iloc[3]['ec_ae_gap'] == (3 + 2 * 30) - 72
+
+
+def test_streamed_run_writes_trajectories(synthetic_root, synthetic_norms, output_dir):
+    export_file = write_export(synthetic_root, 'trajectories.csv', VISITS)
+    pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms, chunksize=1,
+                    output_file_name='streamed', trajectories=True)
+
+    saved = pd.read_csv(f'{synthetic_root}{output_dir}/streamed_trajectories.csv')
+    expected = trajectories_for(VISITS, synthetic_norms).reset_index()
+    pd.testing.assert_frame_equal(saved, expected, check_dtype=False)
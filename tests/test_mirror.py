@@ -0,0 +1,128 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: The local copy of the reference workbooks (PLS_mirror), including a slow share
+
+import os
+import functools
+import shutil
+import threading
+
+import pytest
+
+import PLS_mirror
+from PLS_batch import pls_Batch_Scoring_Fcn
+from PLS_benchmark import COLUMNS, make_synthetic_export, make_synthetic_norms
+from PLS_mirror import mirror_reference_materials, wait_for_mirror
+from PLS_norms import REF_MATERIALS_DIR, AC_SCORES_FILE
+from PLS_paths import REF_WORKBOOKS
+from conftest import INPUTS_DIR
+
+
+@pytest.fixture
+def share(synthetic_root, tmp_path):
+    # A copy of the synthetic reference workbooks standing in for the network share
+    ref_dir = str(tmp_path / 'share')
+    shutil.copytree(synthetic_root + REF_MATERIALS_DIR, ref_dir)
+    return ref_dir
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    # File names fetched from the share, in order
+    names = []
+    fetch = PLS_mirror._fetch
+
+    def counting_fetch(source_path, local_path):
+        names.append(os.path.basename(source_path))
+        return fetch(source_path, local_path)
+    monkeypatch.setattr(PLS_mirror, '_fetch', counting_fetch)
+    return names
+
+
+def change_workbook(ref_dir, tmp_path):
+    # Replaces the A.1 workbook on the share with different contents
+    make_synthetic_norms(str(tmp_path / 'other'), seed=5)
+    shutil.copy(tmp_path / 'other' / AC_SCORES_FILE, os.path.join(ref_dir, AC_SCORES_FILE))
+
+
+def test_fetches_only_changed_workbooks(share, fetched, tmp_path):
+    mirror_dir = str(tmp_path / 'mirror')
+    mirror_reference_materials(share, mirror_dir)
+    assert sorted(fetched) == sorted(REF_WORKBOOKS)
+    assert wait_for_mirror(timeout=0)
+
+    fetched.clear()
+    mirror_reference_materials(share, mirror_dir)
+    assert fetched == []
+
+    change_workbook(share, tmp_path)
+    mirror_reference_materials(share, mirror_dir)
+    assert fetched == [AC_SCORES_FILE]
+    with open(os.path.join(share, AC_SCORES_FILE), 'rb') as source, \
+            open(os.path.join(mirror_dir, AC_SCORES_FILE), 'rb') as local:
+        assert source.read() == local.read()
+
+
+def test_slow_share(share, tmp_path, monkeypatch):
+    mirror_dir = str(tmp_path / 'mirror')
+    mirror_reference_materials(share, mirror_dir)
+    with open(os.path.join(mirror_dir, AC_SCORES_FILE), 'rb') as f:
+        old_copy = f.read()
+
+    released = threading.Event()
+    fetch = PLS_mirror._fetch
+
+    def slow_fetch(source_path, local_path):
+        released.wait(10)
+        return fetch(source_path, local_path)
+    monkeypatch.setattr(PLS_mirror, '_fetch', slow_fetch)
+    change_workbook(share, tmp_path)
+
+    # The run goes ahead with the local copy; the fetch thread cannot hold up the interpreter's exit
+    mirror_reference_materials(share, mirror_dir, timeout=0.05)
+    with open(os.path.join(mirror_dir, AC_SCORES_FILE), 'rb') as f:
+        assert f.read() == old_copy
+    assert all(thread.daemon for thread in PLS_mirror._fetch_threads)
+    assert not wait_for_mirror(timeout=0.05)
+
+    released.set()
+    assert wait_for_mirror()
+    with open(os.path.join(mirror_dir, AC_SCORES_FILE), 'rb') as f:
+        assert f.read() != old_copy
+
+
+def test_batch_waits_for_the_mirror_before_forking(synthetic_root, tmp_path, monkeypatch):
+    # A root whose reference workbooks are on a slow share
+    root = str(tmp_path / 'root') + '/'
+    share = root + REF_MATERIALS_DIR
+    shutil.copytree(synthetic_root + REF_MATERIALS_DIR, share)
+    os.makedirs(root + INPUTS_DIR)
+    make_synthetic_export(root + INPUTS_DIR + 'export.csv', 10, seed=1, missing_rate=0)
+    mirror_dir = str(tmp_path / 'mirror')
+    mirror_reference_materials(share, mirror_dir)
+    # No .npz cache, and a short wait for the share before the run goes ahead with the local copies
+    monkeypatch.setattr('PLS_batch.load_mirrored_norms',
+                        functools.partial(PLS_mirror.load_mirrored_norms, cache_dir=None, timeout=0.05))
+
+    released = threading.Event()
+    fetch = PLS_mirror._fetch
+
+    def slow_fetch(source_path, local_path):
+        released.wait(10)
+        return fetch(source_path, local_path)
+    monkeypatch.setattr(PLS_mirror, '_fetch', slow_fetch)
+    change_workbook(share, tmp_path)
+
+
+    forks = []
+    wait = PLS_mirror.wait_for_mirror
+
+    def waiting(timeout=None):
+        threading.Timer(0.1, released.set).start()
+        forks.append(wait(timeout))
+        return forks[-1]
+    monkeypatch.setattr('PLS_batch.wait_for_mirror', waiting)
+
+    results = pls_Batch_Scoring_Fcn(root, INPUTS_DIR, *COLUMNS, os.path.relpath(tmp_path / 'out', root),
+                                    mirror_dir=mirror_dir)
+    assert forks == [True] and list(results) == [INPUTS_DIR + 'export.csv']
+    assert wait_for_mirror(timeout=0)
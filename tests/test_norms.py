@@ -0,0 +1,31 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Age parsing and the age-band lookup (PLS_norms.find_age_bands)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from BRIDGE_PLS import parse_age_values
+from PLS_norms import find_age_bands, AGE_BAND_MONTHS, AGE_BAND_SHEETS, AGE_BAND_END
+
+
+def test_every_month_finds_its_band():
+    age_months = np.arange(AGE_BAND_END)
+    expected = [next(sheet for sheet in AGE_BAND_SHEETS
+                     if AGE_BAND_MONTHS[sheet][0] <= months <= AGE_BAND_MONTHS[sheet][1])
+                for months in age_months]
+    assert list(find_age_bands(age_months)) == expected
+    assert list(find_age_bands([0, 2, 3, 95])) == ['0.0-0.2', '0.0-0.2', '0.3-0.5', '7.6-7.11']
+
+
+def test_ages_outside_the_bands():
+    assert list(find_age_bands([-1, AGE_BAND_END, np.nan, 41.5])) == [None, None, None, '3.0-3.5']
+
+
+def test_parse_age_values():
+    age_strings, total_months = parse_age_values(pd.Series(['3y2m', '3:2', '3.2', ' 3 y 2 m ', '3.12']))
+    assert age_strings.tolist() == ['3.2'] * 4 + ['3.12']
+    assert total_months.tolist() == [38] * 4 + [pd.NA]
+
+    with pytest.raises(ValueError, match='3 years'):
+        parse_age_values(pd.Series(['3y2m', '3 years']))
@@ -0,0 +1,82 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Pulling, scoring and pushing through the REDCap API (PLS_redcap) against the local
+#          mock REDCap server (PLS_redcap_mock)
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('requests')
+
+from PLS_benchmark import COLUMNS
+from PLS_redcap import REDCapClient, REDCapError, pls_REDCap_Scoring_Fcn
+from PLS_redcap_mock import MockREDCapServer
+
+RECORDS = [
+    {'subject_id': 'BR-1', 'redcap_event_name': 'visit_1_arm_1', 'chron_age_pls': '3y2m',
+     'pls_aud_comp_raw': '20', 'pls_exp_comm_raw': '25', 'other_field': 'x'},
+    {'subject_id': 'BR-1', 'redcap_event_name': 'visit_2_arm_1', 'chron_age_pls': '4y0m',
+     'pls_aud_comp_raw': '30', 'pls_exp_comm_raw': '31', 'other_field': 'y'},
+    {'subject_id': 'BR-2', 'redcap_event_name': 'visit_1_arm_1', 'chron_age_pls': '2:6',
+     'pls_aud_comp_raw': '15', 'pls_exp_comm_raw': '-999', 'other_field': 'z'},
+    {'subject_id': 'S004', 'redcap_event_name': 'visit_1_arm_1', 'chron_age_pls': '5.1',
+     'pls_aud_comp_raw': '40', 'pls_exp_comm_raw': '41', 'other_field': ''},
+]
+
+
+def test_pull_score_and_push(synthetic_root, synthetic_norms):
+    with MockREDCapServer(RECORDS) as server:
+        df_final = pls_REDCap_Scoring_Fcn(synthetic_root, server.url, 'TEST', *COLUMNS, norms=synthetic_norms,
+                                          page_size=2)
+        # One request for the record IDs, two pages of at most two record IDs, and one import batch
+        assert server.requests == 1 + 2 + 1
+
+        assert df_final.index.tolist() == ['BR-1', 'BR-1', 'BR-2', 'S004']
+        pushed = {(record['subject_id'], record['redcap_event_name']): record for record in server.records}
+        # Scores land on the pulled records (no new records for IDs containing '-')
+        assert len(server.records) == len(RECORDS)
+        for subject_id, event, score in [('BR-1', 'visit_2_arm_1', 'pls_aud_comp_ss'),
+                                         ('BR-2', 'visit_1_arm_1', 'pls_total_ss_2')]:
+            expected = str(df_final[df_final['redcap_event_name'] == event].loc[subject_id, score])
+            assert pushed[subject_id, event][score] == expected
+        assert pushed['BR-2', 'visit_1_arm_1']['pls_total_ss_2'] == '-999'
+        assert pushed['BR-1', 'visit_1_arm_1']['other_field'] == 'x'
+
+
+def test_push_false_imports_nothing(synthetic_root, synthetic_norms):
+    with MockREDCapServer(RECORDS) as server:
+        df_final = pls_REDCap_Scoring_Fcn(synthetic_root, server.url, 'TEST', *COLUMNS, norms=synthetic_norms,
+                                          push=False)
+        assert len(df_final) == len(RECORDS)
+        assert 'pls_aud_comp_ss' not in server.records[0]
+
+
+def test_retries_failed_requests():
+    with MockREDCapServer(RECORDS) as server:
+        server.fail_next = 2
+        with REDCapClient(server.url, 'TEST', retries=2, backoff=0) as client:
+            records = client.export_records(list(COLUMNS), 'subject_id', event_field='redcap_event_name')
+        assert len(records) == len(RECORDS)
+        assert server.requests == 2 + 2
+
+        server.fail_next = 2
+        with REDCapClient(server.url, 'TEST', retries=1, backoff=0) as client:
+            with pytest.raises(REDCapError, match='503'):
+                client.export_records(list(COLUMNS), 'subject_id', event_field='redcap_event_name')
+
+
+def test_event_field_is_not_requested():
+    with MockREDCapServer(RECORDS) as server, REDCapClient(server.url, 'TEST', backoff=0) as client:
+        # REDCap rejects the event column as a field...
+        with pytest.raises(REDCapError, match='redcap_event_name'):
+            client.export_records(list(COLUMNS), 'subject_id')
+        # ...but adds it to every exported row itself
+        records = client.export_records(list(COLUMNS), 'subject_id', event_field='redcap_event_name')
+        assert records['redcap_event_name'].tolist() == [record['redcap_event_name'] for record in RECORDS]
+        assert set(records.columns) == set(COLUMNS)
+
+
+def test_empty_project():
+    with MockREDCapServer([], fields=COLUMNS) as server, REDCapClient(server.url, 'TEST', backoff=0) as client:
+        records = client.export_records(list(COLUMNS), 'subject_id', event_field='redcap_event_name')
+        assert isinstance(records, pd.DataFrame) and records.empty
+        assert list(records.columns) == list(COLUMNS)
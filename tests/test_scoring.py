@@ -0,0 +1,232 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Checks the vectorized scoring against the original row-by-row (iterrows) scorer on the
+#          synthetic norms from PLS_benchmark. Run with: python -m pytest
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from BRIDGE_PLS import raw_scores_from_records, prepare_raw_scores, score_raw_scores
+from PLS_benchmark import COLUMNS, MAX_RAW, make_synthetic_norms
+from PLS_norms import (load_norms, find_age_bands, AGE_BAND_SHEETS, REF_MATERIALS_DIR, AC_SCORES_FILE, TOTAL_SS_FILE,
+                       AC_AE_FILE, EC_AE_FILE, TOTAL_AE_FILE)
+
+# Age band whose A.1 sheet gets extra rows for the last-row-wins cases
+EDITED_BAND = '3.0-3.5'
+DUPLICATE_RAW = 20
+DUPLICATE_ROW = [DUPLICATE_RAW, 140, 90]
+LAST_ROW = [1, 77, 7]
+
+
+@pytest.fixture(scope='module')
+def root_filepath(tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('root')) + '/'
+    ref_dir = root + REF_MATERIALS_DIR
+    make_synthetic_norms(ref_dir, seed=1)
+
+    # A duplicated raw score (the later row wins) and a last row below the floor (it still wins)
+    ac_path = os.path.join(ref_dir, AC_SCORES_FILE)
+    sheets = pd.read_excel(ac_path, sheet_name=None, header=None)
+    sheets[EDITED_BAND] = pd.concat([sheets[EDITED_BAND], pd.DataFrame([DUPLICATE_ROW, LAST_ROW])],
+                                    ignore_index=True)
+    with pd.ExcelWriter(ac_path) as writer:
+        for sheet, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet, header=False, index=False)
+    return root
+
+
+@pytest.fixture(scope='module')
+def norms(root_filepath):
+    return load_norms(root_filepath + REF_MATERIALS_DIR, cache_dir=None)
+
+
+# Baseline: the original iterrows() scorer, minus its per-row workbook reads ----------------------
+
+def baseline_age_band(age):
+    # find_ref_table from the original script
+    age_int, age_dec = map(int, age.split('.'))
+    for age_range_sheet_name in AGE_BAND_SHEETS:
+        start_age_str, end_age_str = age_range_sheet_name.split('-')
+        start_age_int, start_age_dec = map(int, start_age_str.split('.'))
+        end_age_int, end_age_dec = map(int, end_age_str.split('.'))
+        if (age_int == start_age_int and age_int == end_age_int) and (start_age_dec <= age_dec <= end_age_dec):
+            return age_range_sheet_name
+        elif age_int == start_age_int and age_int < end_age_int and age_dec >= start_age_dec:
+            return age_range_sheet_name
+        elif age_int > start_age_int and age_int == end_age_int and age_dec <= end_age_dec:
+            return age_range_sheet_name
+        elif start_age_int < age_int and age_int < end_age_int:
+            return age_range_sheet_name
+    return None
+
+
+def baseline_ss_pr(raw, ref_table):
+    # Every row of the sheet is visited, so the last row that matches wins
+    ss_score, percentile_rank = -999, -999
+    if raw == -999:
+        return ss_score, percentile_rank
+    for _, row in ref_table.iterrows():
+        if raw == row.iloc[0]:
+            ss_score, percentile_rank = row.iloc[1], row.iloc[2]
+        elif raw < ref_table.iloc[1, 0]:
+            ss_score, percentile_rank = ref_table.iloc[0, 1], ref_table.iloc[0, 2]
+        elif raw == 999:
+            ss_score, percentile_rank = 999, 999
+    return ss_score, percentile_rank
+
+
+def baseline_ae(raw, ae_ref_table):
+    if raw == -999:
+        return -999, -999, -999
+    match = ae_ref_table.loc[ae_ref_table.iloc[:, 0] == raw]
+    if match.empty:
+        return -999, -999, -999
+    prefix, years, months = re.match(r'([<>]?)(\d+)-(\d+)', match.iloc[0, 1]).groups()
+    years, months = int(years), int(months)
+    return f'{prefix}{years}y{months}m', f'{prefix}{years * 12 + months}', match.iloc[0, 2]
+
+
+def baseline_scores(export, ref_dir):
+    '''
+    Scores an export (DataFrame with the COLUMNS) the way the original script did, one row at a time
+
+    - Like the original, a row whose SS sum matches no A.3 range keeps the previous row's totals
+    '''
+    ac_tables = pd.read_excel(os.path.join(ref_dir, AC_SCORES_FILE), sheet_name=None, header=None)
+    ec_tables = pd.read_excel(os.path.join(ref_dir, 'A.2 EC Scores.xlsx'), sheet_name=None, header=None)
+    total_ss_ref_table = pd.read_excel(os.path.join(ref_dir, TOTAL_SS_FILE), header=None)
+    ac_ae_ref_table = pd.read_excel(os.path.join(ref_dir, AC_AE_FILE))
+    ec_ae_ref_table = pd.read_excel(os.path.join(ref_dir, EC_AE_FILE))
+    total_ae_ref_table = pd.read_excel(os.path.join(ref_dir, TOTAL_AE_FILE))
+
+    rows = []
+    total_ss_score = total_pr_score = None
+    for subject_id, event, age, ac_raw, ec_raw in export[list(COLUMNS)].itertuples(index=False):
+        match = re.match(r'(\d+)y(\d+)m', age)
+        age_group = baseline_age_band(f'{match[1]}.{match[2]}' if match else age)
+        ac_ss, ac_pr = baseline_ss_pr(ac_raw, ac_tables[age_group])
+        ec_ss, ec_pr = baseline_ss_pr(ec_raw, ec_tables[age_group])
+
+        if ac_ss == 999 or ec_ss == 999:
+            total_ss_score = total_pr_score = 999
+        else:
+            sum_ac_ec_ss_score = ac_ss + ec_ss
+            for _, ref_row in total_ss_ref_table.iterrows():
+                range_of_sum = ref_row.iloc[0]
+                if sum_ac_ec_ss_score == 999:
+                    total_ss_score = total_pr_score = 999
+                    break
+                elif '-' in str(range_of_sum):
+                    lower, upper = map(int, range_of_sum.split('-'))
+                    if lower <= sum_ac_ec_ss_score <= upper:
+                        total_ss_score, total_pr_score = ref_row.iloc[1], ref_row.iloc[2]
+                        break
+                elif int(range_of_sum) == sum_ac_ec_ss_score:
+                    total_ss_score, total_pr_score = ref_row.iloc[1], ref_row.iloc[2]
+                    break
+
+        ac_ae_ym, ac_ae_m, ac_gsv = baseline_ae(ac_raw, ac_ae_ref_table)
+        ec_ae_ym, ec_ae_m, ec_gsv = baseline_ae(ec_raw, ec_ae_ref_table)
+        sum_ac_ec_raw = -999 if ac_raw == -999 or ec_raw == -999 else ac_raw + ec_raw
+        total_ae_ym, total_ae_m, _ = baseline_ae(sum_ac_ec_raw, total_ae_ref_table)
+
+        rows.append({
+            'subject_id': subject_id, 'redcap_event_name': event,
+            'pls_aud_comp_raw': ac_raw, 'pls_aud_comp_ss': ac_ss, 'pls_aud_comp_pr': ac_pr,
+            'pls_aud_comp_ae_ym': ac_ae_ym, 'pls_aud_comp_ae_m': ac_ae_m,
+            'pls_exp_comm_raw': ec_raw, 'pls_exp_comm_ss': ec_ss, 'pls_exp_comm_pr': ec_pr,
+            'pls_exp_comm_ae_ym': ec_ae_ym, 'pls_exp_comm_ae_m': ec_ae_m,
+            'pls_total_ss_2': total_ss_score, 'pls_total_pr': total_pr_score,
+            'pls_total_ae_ym': total_ae_ym, 'pls_total_ae_m': total_ae_m,
+            'pls_gsv_ac': ac_gsv, 'pls_gsv_ec': ec_gsv, 'preschool_language_scale_complete': 2,
+        })
+    return pd.DataFrame(rows).set_index('subject_id')
+
+
+# Tests --------------------------------------------------------------------------------------------
+
+def make_export(seed=0, n_rows=300):
+    '''
+    Returns an export covering every age band, the -999 and 999 codes, raw scores below each band's
+    floor and the edited rows of EDITED_BAND (#y#m and y.m ages, the formats the original accepted)
+
+    - Leaves out 1:0 and 1:1, which the original put in the overlapping '0.9-1.1' sheet
+      (see test_overlapping_age_bands)
+    '''
+    rng = np.random.default_rng(seed)
+    age_months = rng.choice(np.setdiff1d(np.arange(1, 96), [12, 13]), n_rows)
+    ages = [f'{years}y{months}m' if i % 2 else f'{years}.{months}'
+            for i, (years, months) in enumerate(divmod(int(m), 12) for m in age_months)]
+    ac_raw = rng.integers(0, MAX_RAW, n_rows)
+    ec_raw = rng.integers(0, MAX_RAW, n_rows)
+    codes = rng.random((2, n_rows))
+    ac_raw = np.where(codes[0] < 0.05, -999, np.where(codes[0] > 0.97, 999, ac_raw))
+    ec_raw = np.where(codes[1] < 0.05, -999, np.where(codes[1] > 0.97, 999, ec_raw))
+
+    # The first row must score normally: the original has no previous totals to fall back on
+    edge_rows = [('3.0', 10, 10), ('3.2', DUPLICATE_RAW, 5), ('3y4m', LAST_ROW[0], 12), ('3.5', 0, 30),
+                 ('3y1m', 999, 15), ('3.3', -999, 20), ('3.1', 2, -999)]
+    ages = [age for age, _, _ in edge_rows] + ages
+    ac_raw = [ac for _, ac, _ in edge_rows] + list(ac_raw)
+    ec_raw = [ec for _, _, ec in edge_rows] + list(ec_raw)
+
+    return pd.DataFrame({
+        'subject_id': [f'S{i:05d}' for i in range(len(ages))],
+        'redcap_event_name': ['visit_1_arm_1'] * len(ages),
+        'chron_age_pls': ages,
+        'pls_aud_comp_raw': ac_raw,
+        'pls_exp_comm_raw': ec_raw,
+    })
+
+
+def score(export, norms):
+    raw_scores_df = prepare_raw_scores(raw_scores_from_records(export.astype(str), COLUMNS), COLUMNS)
+    return score_raw_scores(raw_scores_df, norms, 'subject_id', 'redcap_event_name')
+
+
+def test_matches_baseline_scorer(root_filepath, norms):
+    export = make_export()
+    expected = baseline_scores(export, root_filepath + REF_MATERIALS_DIR).astype(str)
+    df_final = score(export, norms).astype(str)
+
+    assert list(df_final.columns) == list(expected.columns)
+    assert list(df_final.index) == list(expected.index)
+
+    # Intended difference: with a -999 SS the original kept the previous row's totals, now they are -999
+    ac_ss = df_final['pls_aud_comp_ss'].astype(int).to_numpy()
+    ec_ss = df_final['pls_exp_comm_ss'].astype(int).to_numpy()
+    missing_ss = ((ac_ss == -999) | (ec_ss == -999)) & (ac_ss != 999) & (ec_ss != 999)
+    assert missing_ss.any()
+    totals = ['pls_total_ss_2', 'pls_total_pr']
+    assert (df_final.loc[missing_ss, totals] == '-999').all().all()
+    for position in np.flatnonzero(missing_ss):
+        assert expected.iloc[position][totals].tolist() == expected.iloc[position - 1][totals].tolist()
+
+    # Everything else is unchanged
+    pd.testing.assert_frame_equal(df_final[~missing_ss], expected[~missing_ss])
+    others = [column for column in df_final.columns if column not in totals]
+    pd.testing.assert_frame_equal(df_final[others], expected[others])
+
+
+def test_ss_pr_rules(root_filepath, norms):
+    df_final = score(make_export(), norms).reset_index()
+    edited = pd.read_excel(os.path.join(root_filepath + REF_MATERIALS_DIR, AC_SCORES_FILE), sheet_name=EDITED_BAND,
+                           header=None)
+    floor_ss, floor_pr = edited.iloc[0, 1], edited.iloc[0, 2]
+
+    # Rows 1-5 of make_export: duplicated raw score, last row below the floor, floor rule, 999, -999
+    assert df_final.loc[1, ['pls_aud_comp_ss', 'pls_aud_comp_pr']].tolist() == DUPLICATE_ROW[1:]
+    assert df_final.loc[2, ['pls_aud_comp_ss', 'pls_aud_comp_pr']].tolist() == LAST_ROW[1:]
+    assert df_final.loc[3, ['pls_aud_comp_ss', 'pls_aud_comp_pr']].tolist() == [floor_ss, floor_pr]
+    assert df_final.loc[4, ['pls_aud_comp_ss', 'pls_aud_comp_pr', 'pls_total_ss_2']].tolist() == [999, 999, 999]
+    assert df_final.loc[5, ['pls_aud_comp_ss', 'pls_total_ss_2', 'pls_total_ae_m']].tolist() == [-999, -999, -999]
+
+
+def test_overlapping_age_bands():
+    # Intended difference: 1:0 and 1:1 now use the '1.0-1.5' sheet, as in the PLS-5 manual
+    assert [baseline_age_band(age) for age in ['0.11', '1.0', '1.1', '1.2']] == ['0.9-1.1'] * 3 + ['1.0-1.5']
+    assert list(find_age_bands([11, 12, 13, 14])) == ['0.9-1.1'] + ['1.0-1.5'] * 3
+
@@ -0,0 +1,92 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: The warm scoring service (PLS_service) over HTTP, including hot reloads of the norms
+
+import os
+import json
+import shutil
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from PLS_benchmark import make_synthetic_norms
+from PLS_norms import REF_MATERIALS_DIR, AC_SCORES_FILE
+from PLS_service import make_server
+
+RECORD = {'subject_id': 'BR-1', 'redcap_event_name': 'visit_1_arm_1', 'chron_age_pls': '3y2m',
+          'pls_aud_comp_raw': '20', 'pls_exp_comm_raw': '25'}
+
+
+@pytest.fixture
+def service(synthetic_root, tmp_path):
+    # A server on its own copy of the workbooks, checking them for changes on every request
+    root = str(tmp_path) + '/'
+    shutil.copytree(synthetic_root + REF_MATERIALS_DIR, root + REF_MATERIALS_DIR)
+    server = make_server(root, port=0, check_interval=0, cache_dir=None)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    server.ref_dir = root + REF_MATERIALS_DIR
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, path, body=None):
+    # (status, JSON body) of a GET, or of a POST when body is given
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(server.url + path, data=data), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_scores_records(service):
+    status, body = request(service, '/score', {'records': [RECORD, dict(RECORD, subject_id='BR-2')]})
+    assert status == 200
+    assert [record['subject_id'] for record in body['records']] == ['BR', 'BR']
+    assert body['norms_version'] == service.watcher.norms.version
+
+    # A single record works too
+    status, body = request(service, '/score', RECORD)
+    assert status == 200 and len(body['records']) == 1
+
+
+def test_failed_reload_keeps_serving(service, tmp_path):
+    version = service.watcher.norms.version
+    workbook = os.path.join(service.ref_dir, AC_SCORES_FILE)
+    with open(workbook, 'rb') as f:
+        contents = f.read()
+
+    # A workbook caught mid-save: the old norms keep being served
+    with open(workbook, 'wb') as f:
+        f.write(contents[:100])
+    for _ in range(2):
+        assert request(service, '/health')[0] == 200
+        status, body = request(service, '/score', RECORD)
+        assert status == 200 and body['norms_version'] == version
+
+    # A missing workbook too
+    os.remove(workbook)
+    assert request(service, '/score', RECORD)[0] == 200
+
+    # Once a (changed) workbook is back, the next check loads it
+    make_synthetic_norms(str(tmp_path / 'other'), seed=5)
+    shutil.copy(tmp_path / 'other' / AC_SCORES_FILE, workbook)
+    status, body = request(service, '/health')
+    assert status == 200 and body['norms_version'] != version
+
+
+def test_records_that_cannot_be_scored(service):
+    # Not records at all
+    status, body = request(service, '/score', [1, 2])
+    assert status == 400 and [problem['row'] for problem in body['problems']] == [0, 1]
+
+    # A misspelled age field: nothing is scored rather than the record being left out
+    misspelled = {key if key != 'chron_age_pls' else 'chron_age': value for key, value in RECORD.items()}
+    misspelled['subject_id'] = 'BR-2'
+    status, body = request(service, '/score', {'records': [RECORD, misspelled]})
+    assert status == 400
+    assert [(problem['row'], problem['column']) for problem in body['problems']] == [(1, 'chron_age_pls')]
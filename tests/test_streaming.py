@@ -0,0 +1,47 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: Streaming mode (chunksize) of pls_Scoring_Fcn: a streamed run writes the same file as a full one
+
+import pandas as pd
+import pytest
+
+from BRIDGE_PLS import pls_Scoring_Fcn
+from PLS_benchmark import COLUMNS, make_synthetic_export
+from conftest import INPUTS_DIR, write_export
+
+
+def score_both_ways(root_filepath, export_file, output_dir, norms, chunksize):
+    # Bytes of the full and the streamed output
+    outputs = []
+    for output_file_name, chunksize in [('full', None), ('streamed', chunksize)]:
+        returned = pls_Scoring_Fcn(root_filepath, export_file, *COLUMNS, output_dir, norms=norms,
+                                   chunksize=chunksize, output_file_name=output_file_name)
+        with open(f'{root_filepath}{output_dir}/{output_file_name}.csv', 'rb') as f:
+            outputs.append(f.read())
+    assert returned is None
+    return outputs
+
+
+@pytest.mark.parametrize('chunksize', [1, 37, 1000])
+def test_streaming_output_is_byte_identical(synthetic_root, synthetic_norms, output_dir, chunksize):
+    export_file = INPUTS_DIR + 'streaming.csv'
+    make_synthetic_export(synthetic_root + export_file, 500, seed=3, extra_columns=5)
+    full, streamed = score_both_ways(synthetic_root, export_file, output_dir, synthetic_norms, chunksize)
+    assert full == streamed
+
+
+def test_chunks_without_any_age(synthetic_root, synthetic_norms, output_dir):
+    # The first chunk has nothing to score, the header still comes first and only once
+    rows = [('S001', 'visit_1_arm_1', '', '', ''), ('S002', 'visit_1_arm_1', '', 10, 10),
+            ('S003', 'visit_1_arm_1', '3y2m', 20, 25), ('S004', 'visit_1_arm_1', '4.0', 30, 31)]
+    export_file = write_export(synthetic_root, 'no_ages.csv', rows)
+    full, streamed = score_both_ways(synthetic_root, export_file, output_dir, synthetic_norms, 2)
+    assert full == streamed
+    assert pd.read_csv(f'{synthetic_root}{output_dir}/streamed.csv')['subject_id'].tolist() == ['S003', 'S004']
+
+
+def test_xlsx_exports_cannot_be_streamed(synthetic_root, synthetic_norms, output_dir):
+    export_file = write_export(synthetic_root, 'stream.csv', [('S001', 'visit_1_arm_1', '3y2m', 20, 25)])
+    xlsx_file = export_file.replace('.csv', '.xlsx')
+    pd.read_csv(synthetic_root + export_file).to_excel(synthetic_root + xlsx_file, index=False)
+    with pytest.raises(ValueError, match='needs a .csv'):
+        pls_Scoring_Fcn(synthetic_root, xlsx_file, *COLUMNS, output_dir, norms=synthetic_norms, chunksize=10)
@@ -0,0 +1,79 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: The pre-scoring validation pass (PLS_validation) and on_invalid in pls_Scoring_Fcn,
+#          for whole exports and streamed ones
+
+import os
+
+import pandas as pd
+import pytest
+
+from BRIDGE_PLS import pls_Scoring_Fcn, read_raw_scores
+from PLS_benchmark import COLUMNS, MAX_RAW
+from PLS_validation import validate_raw_scores, validate_export, ValidationError
+from conftest import write_export
+
+VISITS = [
+    ('S001', 'visit_1_arm_1', '3y2m', 20, 25),
+    ('', 'visit_1_arm_1', '3y2m', 20, 25),                 # 1: missing subject ID
+    ('S002', 'visit_1_arm_1', '3 years', 20, 25),          # 2: unsupported age format
+    ('S003', 'visit_1_arm_1', '3:12', 20, 25),             # 3: months must be 0-11
+    ('S004', 'visit_1_arm_1', '9y0m', 20, 25),             # 4: age outside the norms
+    ('S005', 'visit_1_arm_1', '4y0m', '', 25),             # 5: missing raw score
+    ('S006', 'visit_1_arm_1', '4y0m', 20.5, MAX_RAW + 5),  # 6: fractional, then not in the norms
+    ('S007', 'visit_1_arm_1', '4y0m', -999, 30),
+    ('S007', 'visit_1_arm_1', '4y6m', 21, 30),             # 7-8: duplicate subject/event pair
+    ('S008', 'visit_1_arm_1', '', '', ''),                 # never scored, so not checked
+    ('S009', 'visit_2_arm_1', '5.1', -999, 40),
+]
+VALID_ROWS = [0, 10]
+
+
+def test_report(synthetic_root, synthetic_norms):
+    export_file = write_export(synthetic_root, 'validation.csv', VISITS)
+    report = validate_raw_scores(read_raw_scores(synthetic_root + export_file, COLUMNS), COLUMNS, synthetic_norms)
+
+    assert report['row'].tolist() == [1, 2, 3, 4, 5, 6, 6, 7, 8]
+    assert report['column'].tolist() == ['subject_id', 'chron_age_pls', 'chron_age_pls', 'chron_age_pls',
+                                         'pls_aud_comp_raw', 'pls_aud_comp_raw', 'pls_exp_comm_raw',
+                                         'redcap_event_name', 'redcap_event_name']
+    problems = report['problem'].tolist()
+    assert problems[:3] == ['missing subject ID', 'unsupported age format (use #y#m, y:m or y.m)',
+                            'months must be 0-11']
+    assert problems[3].startswith('age outside the PLS norms')
+    assert problems[6].startswith('raw score not in the EC norms for age band')
+    assert problems[7:] == ['duplicate subject/event pair'] * 2
+
+    # The same report from an export read in chunks, with the duplicate split across two chunks
+    chunks = read_raw_scores(synthetic_root + export_file, COLUMNS, chunksize=4)
+    chunked_report = validate_export(chunks, COLUMNS, synthetic_norms)
+    pd.testing.assert_frame_equal(chunked_report.astype(str), report.astype(str).replace('None', 'nan'))
+
+
+@pytest.mark.parametrize('chunksize', [None, 4])
+def test_skip(synthetic_root, synthetic_norms, output_dir, chunksize):
+    export_file = write_export(synthetic_root, 'validation.csv', VISITS)
+    pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms, chunksize=chunksize,
+                    output_file_name='scored', on_invalid='skip')
+
+    scored = pd.read_csv(f'{synthetic_root}{output_dir}/scored.csv', dtype=str)
+    assert scored['subject_id'].tolist() == [VISITS[row][0] for row in VALID_ROWS]
+    errors = pd.read_csv(f'{synthetic_root}{output_dir}/scored_errors.csv')
+    assert errors['row'].unique().tolist() == [1, 2, 3, 4, 5, 6, 7, 8]
+
+
+@pytest.mark.parametrize('chunksize', [None, 4])
+def test_raise(synthetic_root, synthetic_norms, output_dir, chunksize):
+    export_file = write_export(synthetic_root, 'validation.csv', VISITS)
+    with pytest.raises(ValidationError, match='8 invalid rows') as error:
+        pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms,
+                        chunksize=chunksize, output_file_name='scored', on_invalid='raise')
+
+    # Nothing is scored; the report is saved and carried by the error
+    assert os.listdir(synthetic_root + output_dir) == ['scored_errors.csv']
+    assert len(error.value.report) == 9
+
+    # A valid export goes through
+    export_file = write_export(synthetic_root, 'valid.csv', [VISITS[row] for row in VALID_ROWS])
+    pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms, chunksize=chunksize,
+                    output_file_name='valid', on_invalid='raise')
+    assert len(pd.read_csv(f'{synthetic_root}{output_dir}/valid.csv')) == len(VALID_ROWS)
@@ -0,0 +1,69 @@
+# CREATORS: Michael Khela and Shefali Verma
+# PURPOSE: The XLSX and Parquet output writers (PLS_writers), checked against the CSV import file
+
+import pandas as pd
+import pytest
+
+from BRIDGE_PLS import pls_Scoring_Fcn
+from PLS_benchmark import COLUMNS, make_synthetic_export
+from PLS_writers import open_writer
+from conftest import INPUTS_DIR
+
+
+def read_output(path, output_format):
+    # Every value as text ('' when empty), the way the CSV import file holds it
+    if output_format == 'csv':
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif output_format == 'xlsx':
+        df = pd.read_excel(path, dtype=str, keep_default_na=False)
+    else:
+        df = pd.read_parquet(path)
+        df = df.astype(object).where(df.notna(), '').astype(str)
+    return df
+
+
+@pytest.fixture(scope='module')
+def export_file(synthetic_root):
+    export_file = INPUTS_DIR + 'writers.csv'
+    make_synthetic_export(synthetic_root + export_file, 40, seed=3, extra_columns=2)
+    return export_file
+
+
+@pytest.mark.parametrize('output_format', ['xlsx', 'parquet'])
+@pytest.mark.parametrize('chunksize', [None, 7])
+def test_round_trip(synthetic_root, synthetic_norms, export_file, output_dir, output_format, chunksize):
+    if output_format == 'parquet':
+        pytest.importorskip('pyarrow')
+    pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms,
+                    output_file_name='expected')
+    pls_Scoring_Fcn(synthetic_root, export_file, *COLUMNS, output_dir, norms=synthetic_norms, chunksize=chunksize,
+                    output_file_name='scored', output_format=output_format)
+
+    expected = read_output(f'{synthetic_root}{output_dir}/expected.csv', 'csv')
+    scored = read_output(f'{synthetic_root}{output_dir}/scored.{output_format}', output_format)
+    assert len(expected) == 40
+    pd.testing.assert_frame_equal(scored, expected)
+
+
+def test_parquet_after_empty_chunks(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = pd.DataFrame({'redcap_event_name': ['visit_1_arm_1', 'visit_2_arm_1'], 'pls_aud_comp_ss': [87, -999],
+                       'pls_gsv_ac': ['-999', '410']}, index=pd.Index(['BR', 'S004'], name='subject_id'))
+
+    writer = open_writer(str(tmp_path / 'chunks'), 'parquet')
+    writer.write(df.iloc[:0])
+    writer.write(df)
+    writer.close()
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / 'chunks.parquet'),
+                                  df.reset_index().astype({'pls_aud_comp_ss': 'int64'}))
+
+    # Only empty chunks still leave a file with the columns
+    writer = open_writer(str(tmp_path / 'empty'), 'parquet')
+    writer.write(df.iloc[:0])
+    writer.close()
+    assert list(pd.read_parquet(tmp_path / 'empty.parquet').columns) == ['subject_id'] + list(df.columns)
+
+
+def test_unsupported_format(tmp_path):
+    with pytest.raises(ValueError, match='Unsupported output format'):
+        open_writer(str(tmp_path / 'scored'), 'json')